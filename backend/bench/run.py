@@ -0,0 +1,240 @@
+"""Offline benchmark for the CLI and the /explain API.
+
+Starts the stub LLM and documentation servers from stubs.py, points stackexplain at
+them, sends a seeded workload of errors at a fixed concurrency and reports latency
+percentiles, throughput, upstream calls per request and peak memory as JSON.
+
+    python bench/run.py --target api --requests 200 --concurrency 16 --output before.json
+    python bench/run.py --target cli --requests 40 --concurrency 4
+    python bench/run.py --compare before.json after.json
+"""
+import argparse, asyncio, json, os, platform, random, resource, socket, subprocess, sys, tempfile, threading, time
+from dataclasses import asdict
+import httpx
+import uvicorn
+from stubs import StubConfig, llm_app, docs_app, add_arguments, config_from_args
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(BACKEND_DIR, "src")
+
+_FRAMES = ["handlers/orders.py", "services/billing.py", "models/inventory.py", "jobs/sync.py", "api/routes.py"]
+_FUNCS = ["process", "reconcile", "load_batch", "apply_discount", "render", "fetch_rows"]
+_ERRORS = ["app.errors.InventoryMismatch", "app.errors.StaleLedger", "billing.QuotaOverrun",
+           "sync.RemoteSchemaDrift", "render.TemplateLookupFailure"]
+
+
+def make_error(rng: random.Random) -> str:
+    """A made-up Python traceback that no bundled signature matches."""
+    lines = ["Traceback (most recent call last):"]
+    for _ in range(rng.randint(3, 12)):
+        path = rng.choice(_FRAMES)
+        lines.append(f'  File "/srv/app/{path}", line {rng.randint(10, 900)}, in {rng.choice(_FUNCS)}')
+        lines.append(f"    result = {rng.choice(_FUNCS)}(item_{rng.randint(0, 99)}, strict=True)")
+    lines.append(f"{rng.choice(_ERRORS)}: record {rng.randint(1000, 99999)} failed validation ({rng.randint(1, 9)} fields)")
+    return "\n".join(lines)
+
+
+def workload(count: int, unique: int, seed: int) -> list[str]:
+    """`count` errors drawn from `unique` distinct ones, so repeats exercise the caches."""
+    rng = random.Random(seed)
+    distinct = [make_error(rng) for _ in range(unique)]
+    return [distinct[i % unique] for i in rng.sample(range(count), count)]
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stubs(config: StubConfig) -> tuple[str, str]:
+    """Run the stub servers on background threads; returns (LLM base URL, docs base URL)."""
+    llm_port, docs_port = free_port(), free_port()
+    doc_base = f"http://127.0.0.1:{docs_port}"
+    servers = [
+        uvicorn.Server(uvicorn.Config(llm_app(config, doc_base), port=llm_port, log_level="warning")),
+        uvicorn.Server(uvicorn.Config(docs_app(config), port=docs_port, log_level="warning")),
+    ]
+    for server in servers:
+        threading.Thread(target=server.run, daemon=True).start()
+    while not all(s.started for s in servers):
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{llm_port}", doc_base
+
+
+def stub_env(llm_base: str, cache_dir: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "OPENROUTER_API_KEY": "bench",
+        "STACKEXPLAIN_BASE_URL": f"{llm_base}/v1",
+        "STACKEXPLAIN_CACHE_DIR": cache_dir,
+        "PYTHONPATH": SRC_DIR + os.pathsep + env.get("PYTHONPATH", ""),
+    })
+    # All load comes from one address, so per-client rate limiting is off unless asked for
+    env.setdefault("STACKEXPLAIN_CLIENT_RPM", "0")
+    return env
+
+
+def peak_rss_kb(pid: int) -> int | None:
+    """Peak resident memory of a running process (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+async def run_api(errors: list[str], concurrency: int, env: dict, model: str) -> tuple[list[float], int, int | None]:
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "stackexplain.app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, cwd=BACKEND_DIR)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        async with httpx.AsyncClient(timeout=120, limits=httpx.Limits(max_connections=concurrency)) as client:
+            for _ in range(200):
+                try:
+                    await client.get(f"{base}/health")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+
+            async def one(error: str) -> tuple[float, bool]:
+                started = time.perf_counter()
+                resp = await client.post(f"{base}/explain", json={"error": error, "model": model})
+                ok = resp.status_code == 200 and resp.json().get("error_type") not in ("ModelUnavailable", "InternalError")
+                return time.perf_counter() - started, ok
+
+            latencies, failures = await _drive(errors, concurrency, one)
+        return latencies, failures, peak_rss_kb(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def run_cli(errors: list[str], concurrency: int, env: dict, model: str) -> tuple[list[float], int, int | None]:
+    async def one(error: str) -> tuple[float, bool]:
+        started = time.perf_counter()
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "stackexplain.cli", "--no-daemon", "--no-stream", "--model", model, error,
+            env=env, cwd=BACKEND_DIR, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+        out, _ = await proc.communicate()
+        ok = proc.returncode == 0 and b"ModelUnavailable" not in out and b"InternalError" not in out
+        return time.perf_counter() - started, ok
+
+    latencies, failures = await _drive(errors, concurrency, one)
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return latencies, failures, peak if platform.system() == "Linux" else peak // 1024
+
+
+async def _drive(errors: list[str], concurrency: int, one) -> tuple[list[float], int]:
+    sem = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def worker(error: str) -> None:
+        nonlocal failures
+        async with sem:
+            elapsed, ok = await one(error)
+        latencies.append(elapsed)
+        failures += not ok
+
+    await asyncio.gather(*(worker(e) for e in errors))
+    return latencies, failures
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(args: argparse.Namespace) -> dict:
+    config = config_from_args(args)
+    llm_base, doc_base = start_stubs(config)
+    errors = workload(args.requests, args.unique or args.requests, args.seed)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = stub_env(llm_base, cache_dir)
+        runner = run_api if args.target == "api" else run_cli
+        started = time.perf_counter()
+        latencies, failures, peak_rss = asyncio.run(runner(errors, args.concurrency, env, args.model))
+        wall = time.perf_counter() - started
+    llm_stats = httpx.get(f"{llm_base}/stats").json()
+    doc_stats = httpx.get(f"{doc_base}/stats").json()
+    return {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "target": args.target,
+        "workload": {"requests": args.requests, "unique": args.unique or args.requests,
+                     "concurrency": args.concurrency, "model": args.model, "seed": args.seed},
+        "stubs": asdict(config),
+        "results": {
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 1),
+            "requests_per_s": round(len(latencies) / wall, 2),
+            "failed_requests": failures,
+            "llm_calls_per_request": round(llm_stats.get("completions", 0) / len(latencies), 3),
+            "doc_fetches_per_request": round(doc_stats.get("docs", 0) / len(latencies), 3),
+            "peak_rss_mb": round(peak_rss / 1024, 1) if peak_rss else None,
+            "wall_s": round(wall, 2),
+        },
+        "upstream": {"llm": llm_stats, "docs": doc_stats},
+    }
+
+
+def compare(before_path: str, after_path: str) -> None:
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{'metric':<26}{before.get('revision') or 'before':>14}{after.get('revision') or 'after':>14}{'change':>10}")
+    for key, old in before["results"].items():
+        new = after["results"].get(key)
+        if isinstance(old, (int, float)) and isinstance(new, (int, float)) and old:
+            change = f"{(new - old) / old * 100:+.1f}%"
+        else:
+            change = ""
+        print(f"{key:<26}{str(old):>14}{str(new):>14}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark stackexplain against local stub servers")
+    parser.add_argument("--target", choices=["api", "cli"], default="api")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--unique", type=int, default=0, help="Distinct errors in the workload (default: all distinct)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--model", default="deepseek")
+    parser.add_argument("--output", metavar="FILE", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Compare two JSON reports")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    report = benchmark(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    r = report["results"]
+    print(f"{args.target}: p50 {r['p50_ms']} ms, p95 {r['p95_ms']} ms, p99 {r['p99_ms']} ms, "
+          f"{r['requests_per_s']} req/s, {r['llm_calls_per_request']} LLM calls/request, "
+          f"peak RSS {r['peak_rss_mb']} MB", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
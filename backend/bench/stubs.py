@@ -0,0 +1,196 @@
+"""Local stand-ins for OpenRouter and the documentation sites models link to.
+
+Run both with `python bench/stubs.py` (see --help), or let bench/run.py start them.
+Latencies, failures and malformed answers are drawn from a seeded random generator,
+so a given configuration produces the same mix of behaviour on every run.
+"""
+import argparse, asyncio, hashlib, json, random, threading
+from dataclasses import dataclass, asdict
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+
+
+@dataclass
+class StubConfig:
+    llm_latency_ms: float = 800.0  # median time to the first token
+    llm_latency_sigma: float = 0.5  # spread of the log-normal latency distribution
+    llm_tokens_per_s: float = 200.0  # streaming speed after the first token
+    failure_rate: float = 0.0  # share of completions answered with a 503
+    rate_limit_rate: float = 0.0  # share answered with a 429
+    malformed_rate: float = 0.0  # share whose JSON is wrapped in prose, truncated or otherwise broken
+    doc_latency_ms: float = 50.0
+    slow_doc_latency_ms: float = 10000.0
+    seed: int = 1
+
+
+_MALFORMED = ["prose", "fence", "trailing_comma", "truncated", "garbage"]
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts: dict[str, int] = {}
+
+    def add(self, key: str) -> None:
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return dict(self.counts)
+
+
+def _answer(error: str, doc_base: str) -> dict:
+    """A plausible answer that depends only on the error text."""
+    digest = hashlib.sha256(error.encode()).hexdigest()
+    name = f"BenchError{digest[:6]}"
+    n = int(digest[6:10], 16)
+    # Mostly good links, with the slow, missing and title-less pages the link checker must reject
+    links = [f"{doc_base}/good/{n}", f"{doc_base}/{['slow', '404', 'notitle'][n % 3]}/{n}",
+             f"{doc_base}/good/{n + 1}", f"{doc_base}/404/{n + 2}", f"{doc_base}/good/{n + 3}"]
+    return {
+        "error_type": name,
+        "explanation": f"The operation failed because of {name}. " * 4,
+        "suggested_fix": "Check the inputs that reach the failing call and handle the bad case explicitly. " * 2,
+        "relevant_links": links,
+    }
+
+
+def _malform(content: str, kind: str) -> str:
+    if kind == "prose":
+        return f"Sure! Here is the explanation you asked for:\n{content}\nLet me know if you need more help."
+    if kind == "fence":
+        return f"```json\n{content}\n```"
+    if kind == "trailing_comma":
+        return content[:-1] + ",}"
+    if kind == "truncated":
+        return content[: len(content) * 2 // 3]
+    return "I'm sorry, I can't help with that right now."
+
+
+def llm_app(config: StubConfig, doc_base: str) -> FastAPI:
+    """An OpenAI-compatible /v1/chat/completions endpoint."""
+    app = FastAPI()
+    app.state.stats = stats = Stats()
+    rng = random.Random(config.seed)
+
+    @app.post("/v1/chat/completions")
+    async def completions(req: Request):
+        body = await req.json()
+        stats.add("completions")
+        stats.add(f"model:{body['model']}")
+        roll = rng.random()
+        delay = rng.lognormvariate(0, config.llm_latency_sigma) * config.llm_latency_ms / 1000
+        malformed = rng.choice(_MALFORMED) if rng.random() < config.malformed_rate else None
+        await asyncio.sleep(delay)
+        if roll < config.failure_rate:
+            stats.add("failures")
+            return JSONResponse({"error": {"message": "stub: upstream unavailable"}}, status_code=503)
+        if roll < config.failure_rate + config.rate_limit_rate:
+            stats.add("rate_limited")
+            return JSONResponse({"error": {"message": "stub: rate limited"}}, status_code=429,
+                                headers={"retry-after": "1"})
+
+        error = body["messages"][-1]["content"]
+        content = json.dumps(_answer(error, doc_base))
+        if malformed:
+            stats.add(f"malformed:{malformed}")
+            content = _malform(content, malformed)
+        usage = {"prompt_tokens": sum(len(m["content"]) for m in body["messages"]) // 4,
+                 "completion_tokens": len(content) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if not body.get("stream"):
+            return {"id": "stub", "object": "chat.completion", "created": 0, "model": body["model"],
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                 "finish_reason": "stop"}],
+                    "usage": usage}
+
+        async def chunks():
+            step = 16
+            for i in range(0, len(content), step):
+                chunk = {"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                         "choices": [{"index": 0, "delta": {"content": content[i:i + step]}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(step / 4 / config.llm_tokens_per_s)
+            final = {"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                     "choices": [], "usage": usage}
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    def get_stats():
+        return stats.snapshot()
+
+    return app
+
+
+def docs_app(config: StubConfig) -> FastAPI:
+    """A documentation site with good, slow, missing and title-less pages."""
+    app = FastAPI()
+    app.state.stats = stats = Stats()
+    body = "<p>" + "Documentation text. " * 2000 + "</p>"
+
+    @app.get("/good/{n}")
+    async def good(n: int):
+        stats.add("docs")
+        await asyncio.sleep(config.doc_latency_ms / 1000)
+        return HTMLResponse(f"<html><head><title>Reference page {n}</title></head><body>{body}</body></html>")
+
+    @app.get("/slow/{n}")
+    async def slow(n: int):
+        stats.add("docs")
+        await asyncio.sleep(config.slow_doc_latency_ms / 1000)
+        return HTMLResponse(f"<html><head><title>Slow page {n}</title></head></html>")
+
+    @app.get("/404/{n}")
+    async def missing(n: int):
+        stats.add("docs")
+        await asyncio.sleep(config.doc_latency_ms / 1000)
+        return HTMLResponse("<html><head><title>Not found</title></head></html>", status_code=404)
+
+    @app.get("/notitle/{n}")
+    async def notitle(n: int):
+        stats.add("docs")
+        await asyncio.sleep(config.doc_latency_ms / 1000)
+        return HTMLResponse(f"<html><body>{body}</body></html>")
+
+    @app.get("/stats")
+    def get_stats():
+        return stats.snapshot()
+
+    return app
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    for name, default in asdict(StubConfig()).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(default), default=default)
+
+
+def config_from_args(args: argparse.Namespace) -> StubConfig:
+    return StubConfig(**{name: getattr(args, name) for name in asdict(StubConfig())})
+
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser(description="Run the stub LLM and documentation servers")
+    parser.add_argument("--llm-port", type=int, default=8901)
+    parser.add_argument("--docs-port", type=int, default=8902)
+    add_arguments(parser)
+    args = parser.parse_args()
+    config = config_from_args(args)
+    doc_base = f"http://127.0.0.1:{args.docs_port}"
+
+    async def serve():
+        servers = [
+            uvicorn.Server(uvicorn.Config(llm_app(config, doc_base), port=args.llm_port, log_level="warning")),
+            uvicorn.Server(uvicorn.Config(docs_app(config), port=args.docs_port, log_level="warning")),
+        ]
+        print(f"Stub LLM at http://127.0.0.1:{args.llm_port}/v1, docs at {doc_base}", flush=True)
+        await asyncio.gather(*(s.serve() for s in servers))
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""Regenerate the bundled documentation index (src/stackexplain/app/data/docs_index.json).
+
+The index maps a language and error type to canonical documentation pages, so link
+resolution can accept or supply those links without fetching anything. Python's
+built-in exceptions are read from the running interpreter; everything else comes
+from the lists below. Bump FORMAT_VERSION if the file layout changes.
+
+    python scripts/build_docs_index.py
+    python scripts/build_docs_index.py --node-errors https://nodejs.org/api/errors.json --check
+"""
+import argparse, builtins, datetime, json, os, sys
+
+FORMAT_VERSION = 1
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTPUT = os.path.join(BACKEND_DIR, "src", "stackexplain", "app", "data", "docs_index.json")
+
+PYTHON_DOCS = "https://docs.python.org/3/library/"
+# Standard library exceptions people commonly hit, by the module page that documents them
+PYTHON_STDLIB = {
+    "json": ["JSONDecodeError"],
+    "subprocess": ["CalledProcessError", "TimeoutExpired", "SubprocessError"],
+    "asyncio": ["CancelledError", "InvalidStateError", "IncompleteReadError", "LimitOverrunError",
+                "QueueEmpty", "QueueFull"],
+    "concurrent.futures": ["CancelledError", "BrokenExecutor"],
+    "socket": ["gaierror", "herror", "timeout"],
+    "ssl": ["SSLError", "SSLCertVerificationError", "SSLZeroReturnError", "CertificateError"],
+    "sqlite3": ["OperationalError", "IntegrityError", "ProgrammingError", "DatabaseError", "InterfaceError"],
+    "pickle": ["PicklingError", "UnpicklingError"],
+    "csv": ["Error"],
+    "re": ["error"],
+    "zipfile": ["BadZipFile", "LargeZipFile"],
+    "shutil": ["Error", "SameFileError"],
+    "urllib.error": ["URLError", "HTTPError"],
+    "http.client": ["HTTPException", "RemoteDisconnected", "IncompleteRead"],
+    "configparser": ["NoSectionError", "NoOptionError", "DuplicateSectionError", "ParsingError"],
+    "struct": ["error"],
+    "queue": ["Empty", "Full"],
+    "decimal": ["InvalidOperation", "DivisionByZero"],
+}
+# Too generic to look up without their module name
+AMBIGUOUS = {"Error", "error", "timeout", "Empty", "Full"}
+# Pages for built-in types, which answers about type errors often point to
+PYTHON_PAGES = ["stdtypes.html", "functions.html", "exceptions.html", "constants.html"]
+
+MDN = "https://developer.mozilla.org/en-US/docs/Web/JavaScript/Reference/"
+JS_ERRORS = ["Error", "TypeError", "RangeError", "ReferenceError", "SyntaxError", "EvalError", "URIError",
+             "AggregateError", "InternalError"]
+# MDN's error reference pages, by a pattern for the message browsers and Node print
+JS_MESSAGES = [
+    (r"is not a function", "Errors/Not_a_function"),
+    (r"is not defined", "Errors/Not_defined"),
+    (r"Cannot read propert(?:y|ies) of (?:undefined|null)|is (?:undefined|null)", "Errors/Unexpected_type"),
+    (r"Cannot access '[^']*' before initialization|can't access lexical declaration", "Errors/Cant_access_lexical_declaration_before_init"),
+    (r"Assignment to constant variable|invalid assignment to const", "Errors/Invalid_const_assignment"),
+    (r"is not a constructor", "Errors/Not_a_constructor"),
+    (r"is not iterable", "Errors/is_not_iterable"),
+    (r"Maximum call stack size exceeded|too much recursion", "Errors/Too_much_recursion"),
+    (r"Unexpected token|unexpected token", "Errors/Unexpected_token"),
+    (r"Unexpected end of JSON input|JSON\.parse", "Errors/JSON_bad_parse"),
+    (r"Invalid array length", "Errors/Invalid_array_length"),
+    (r"await is only valid in async function", "Errors/Bad_await"),
+    (r"Cannot use import statement outside a module", "Statements/import"),
+    (r"Converting circular structure to JSON|cyclic object value", "Errors/Cyclic_object_value"),
+    (r"Invalid or unexpected token|illegal character", "Errors/Illegal_character"),
+    (r"Unexpected identifier|missing ; before statement", "Errors/Missing_semicolon_before_statement"),
+    (r"Cannot convert undefined or null to object", "Errors/No_properties"),
+    (r"Reduce of empty array with no initial value", "Errors/Reduce_of_empty_array_with_no_initial_value"),
+    (r"Invalid Date|invalid date", "Errors/Invalid_date"),
+    (r"BigInt", "Errors/Cant_convert_BigInt_to_number"),
+]
+
+NODE_DOCS = "https://nodejs.org/api/errors.html"
+NODE_SYSTEM_ERRORS = ["EACCES", "EADDRINUSE", "ECONNREFUSED", "ECONNRESET", "EEXIST", "EISDIR", "EMFILE",
+                      "ENOENT", "ENOTDIR", "ENOTEMPTY", "ENOTFOUND", "EPERM", "EPIPE", "ETIMEDOUT"]
+NODE_CODES = ["ERR_MODULE_NOT_FOUND", "ERR_REQUIRE_ESM", "ERR_UNKNOWN_FILE_EXTENSION", "ERR_INVALID_ARG_TYPE",
+              "ERR_INVALID_ARG_VALUE", "ERR_UNHANDLED_REJECTION", "ERR_HTTP_HEADERS_SENT", "ERR_STREAM_WRITE_AFTER_END",
+              "ERR_STREAM_PREMATURE_CLOSE", "ERR_OUT_OF_RANGE", "ERR_IMPORT_ASSERTION_TYPE_MISSING",
+              "ERR_IMPORT_ATTRIBUTE_MISSING", "ERR_PACKAGE_PATH_NOT_EXPORTED", "ERR_INVALID_URL",
+              "ERR_SOCKET_CONNECTION_TIMEOUT", "ERR_TLS_CERT_ALTNAME_INVALID", "ERR_WORKER_OUT_OF_MEMORY",
+              "ERR_REQUIRE_ASYNC_MODULE", "ERR_INVALID_PACKAGE_CONFIG", "ERR_ASSERTION", "ERR_INVALID_RETURN_VALUE",
+              "ERR_METHOD_NOT_IMPLEMENTED", "ERR_MISSING_ARGS", "ERR_INVALID_THIS", "ERR_UNSUPPORTED_DIR_IMPORT",
+              "ERR_UNSUPPORTED_ESM_URL_SCHEME", "ERR_USE_AFTER_CLOSE", "ERR_CHILD_PROCESS_STDIO_MAXBUFFER"]
+
+JAVA_DOCS = "https://docs.oracle.com/en/java/javase/21/docs/api/"
+# Common exceptions and errors, by module
+JAVA_CLASSES = {
+    "java.base": [
+        "java.lang.NullPointerException", "java.lang.ArrayIndexOutOfBoundsException",
+        "java.lang.IndexOutOfBoundsException", "java.lang.StringIndexOutOfBoundsException",
+        "java.lang.ClassCastException", "java.lang.ClassNotFoundException", "java.lang.NoClassDefFoundError",
+        "java.lang.NumberFormatException", "java.lang.IllegalArgumentException", "java.lang.IllegalStateException",
+        "java.lang.UnsupportedOperationException", "java.lang.ArithmeticException", "java.lang.OutOfMemoryError",
+        "java.lang.StackOverflowError", "java.lang.InterruptedException", "java.lang.CloneNotSupportedException",
+        "java.lang.NoSuchMethodException", "java.lang.NoSuchMethodError", "java.lang.NoSuchFieldException",
+        "java.lang.NoSuchFieldError", "java.lang.UnsatisfiedLinkError", "java.lang.ExceptionInInitializerError",
+        "java.lang.SecurityException", "java.lang.NegativeArraySizeException", "java.lang.ArrayStoreException",
+        "java.lang.AbstractMethodError", "java.lang.IncompatibleClassChangeError", "java.lang.UnsupportedClassVersionError",
+        "java.lang.IllegalAccessException", "java.lang.InstantiationException", "java.lang.RuntimeException",
+        "java.lang.Exception", "java.lang.Error", "java.lang.AssertionError",
+        "java.lang.reflect.InvocationTargetException",
+        "java.util.ConcurrentModificationException", "java.util.NoSuchElementException",
+        "java.util.InputMismatchException", "java.util.MissingResourceException",
+        "java.util.concurrent.ExecutionException", "java.util.concurrent.TimeoutException",
+        "java.util.concurrent.CancellationException", "java.util.concurrent.RejectedExecutionException",
+        "java.io.IOException", "java.io.FileNotFoundException", "java.io.EOFException",
+        "java.io.UncheckedIOException", "java.io.NotSerializableException", "java.io.UnsupportedEncodingException",
+        "java.net.ConnectException", "java.net.SocketTimeoutException", "java.net.UnknownHostException",
+        "java.net.MalformedURLException", "java.net.URISyntaxException", "java.net.BindException",
+        "java.net.SocketException",
+        "java.nio.file.NoSuchFileException", "java.nio.file.AccessDeniedException",
+        "java.nio.file.FileAlreadyExistsException", "java.nio.file.InvalidPathException",
+        "java.nio.BufferOverflowException", "java.nio.BufferUnderflowException",
+        "java.time.format.DateTimeParseException", "java.time.DateTimeException",
+    ],
+    "java.sql": ["java.sql.SQLException", "java.sql.SQLIntegrityConstraintViolationException",
+                 "java.sql.SQLTimeoutException", "java.sql.SQLSyntaxErrorException"],
+}
+
+
+def python_entries() -> tuple[dict, list[str]]:
+    errors: dict[str, list[str]] = {}
+    for name, value in vars(builtins).items():
+        if isinstance(value, type) and issubclass(value, BaseException):
+            errors[name] = [f"{PYTHON_DOCS}exceptions.html#{name}"]
+    short_names = [name for names in PYTHON_STDLIB.values() for name in names]
+    for module, names in PYTHON_STDLIB.items():
+        page = f"{PYTHON_DOCS}{module}.html"
+        for name in names:
+            url = f"{page}#{module}.{name}"
+            errors[f"{module}.{name}"] = [url]
+            # Answers often give just the class name; use it when it is unambiguous
+            if name not in AMBIGUOUS and short_names.count(name) == 1:
+                errors.setdefault(name, [url])
+    return errors, [PYTHON_DOCS + page for page in PYTHON_PAGES]
+
+
+def javascript_entries() -> tuple[dict, list]:
+    errors = {name: [f"{MDN}Global_Objects/{name}"] for name in JS_ERRORS}
+    messages = [[pattern, MDN + slug] for pattern, slug in JS_MESSAGES]
+    return errors, messages
+
+
+def node_entries(errors_json: str | None) -> tuple[dict, list[str]]:
+    codes = list(NODE_CODES)
+    if errors_json:
+        codes += fetch_node_codes(errors_json)
+    errors = {code: [f"{NODE_DOCS}#common-system-errors"] for code in NODE_SYSTEM_ERRORS}
+    for code in codes:
+        errors.setdefault(code, [f"{NODE_DOCS}#{code.lower()}"])
+    return errors, [NODE_DOCS]
+
+
+def fetch_node_codes(source: str) -> list[str]:
+    """Every ERR_* code documented in Node's errors.json (a URL or a local file)."""
+    if source.startswith(("http://", "https://")):
+        import httpx
+        data = httpx.get(source, follow_redirects=True, timeout=30).json()
+    else:
+        with open(source) as f:
+            data = json.load(f)
+    codes = []
+    for module in data.get("miscs", []) + data.get("modules", []):
+        stack = [module]
+        while stack:
+            section = stack.pop()
+            name = section.get("textRaw", "").strip("`")
+            if name.startswith("ERR_"):
+                codes.append(name)
+            stack.extend(section.get("miscs", []) + section.get("modules", []))
+    return sorted(set(codes))
+
+
+def java_entries() -> dict:
+    errors = {}
+    for module, classes in JAVA_CLASSES.items():
+        for name in classes:
+            errors[name] = [f"{JAVA_DOCS}{module}/{name.replace('.', '/')}.html"]
+    return errors
+
+
+def check(index: dict) -> None:
+    """Drop entries whose page doesn't load (needs network access)."""
+    import httpx
+    seen: dict[str, bool] = {}
+    with httpx.Client(follow_redirects=True, timeout=15) as client:
+        for language in index["languages"].values():
+            for name, urls in list(language["errors"].items()):
+                for url in urls:
+                    page = url.split("#")[0]
+                    if page not in seen:
+                        try:
+                            seen[page] = client.get(page).status_code == 200
+                        except httpx.HTTPError:
+                            seen[page] = False
+                        if not seen[page]:
+                            print(f"dropping {page}", file=sys.stderr)
+                if not all(seen[url.split("#")[0]] for url in urls):
+                    del language["errors"][name]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default=OUTPUT)
+    parser.add_argument("--node-errors", help="Node's errors.json (URL or file) to include every documented ERR_* code")
+    parser.add_argument("--check", action="store_true", help="Fetch every page and drop the ones that fail")
+    args = parser.parse_args()
+
+    python_errors, python_pages = python_entries()
+    js_errors, js_messages = javascript_entries()
+    node_errors, node_pages = node_entries(args.node_errors)
+    index = {
+        "version": FORMAT_VERSION,
+        "built": datetime.date.today().isoformat(),
+        "languages": {
+            "python": {"errors": python_errors, "pages": python_pages},
+            "javascript": {"errors": js_errors, "messages": js_messages},
+            "node": {"errors": node_errors, "pages": node_pages},
+            "java": {"errors": java_entries()},
+        },
+    }
+    if args.check:
+        check(index)
+    with open(args.output, "w") as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+        f.write("\n")
+    count = sum(len(language["errors"]) for language in index["languages"].values())
+    print(f"Wrote {count} entries to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+from dotenv import load_dotenv
+
+# Settings are read from the environment as modules are imported, so .env must be loaded first
+load_dotenv()
@@ -0,0 +1,103 @@
+import os, math, time, asyncio
+from collections import OrderedDict
+from .ratelimit import TokenBucket
+
+# Explanations allowed to wait on a model at once; the rest queue for a slot
+MAX_CONCURRENT = int(os.getenv("STACKEXPLAIN_MAX_CONCURRENT", "16"))
+# Requests allowed to queue; beyond that they are turned away with a 503 straight away
+MAX_QUEUED = int(os.getenv("STACKEXPLAIN_MAX_QUEUED", "32"))
+# Longest a request waits in the queue before giving up with a 503 (seconds)
+MAX_QUEUE_WAIT = float(os.getenv("STACKEXPLAIN_MAX_QUEUE_WAIT", "10"))
+# Requests per minute allowed from one client, with bursts of up to CLIENT_BURST
+CLIENT_RPM = float(os.getenv("STACKEXPLAIN_CLIENT_RPM", "30"))
+CLIENT_BURST = float(os.getenv("STACKEXPLAIN_CLIENT_BURST", "10"))
+MAX_CLIENTS = 10_000
+# Take the client address from X-Forwarded-For (only behind a proxy that sets it)
+TRUST_PROXY = os.getenv("STACKEXPLAIN_TRUST_PROXY", "0") == "1"
+# Input limits
+MAX_ERROR_CHARS = int(os.getenv("STACKEXPLAIN_MAX_ERROR_CHARS", "20000"))
+MAX_REQUEST_BYTES = int(os.getenv("STACKEXPLAIN_MAX_REQUEST_BYTES", str(4 * 1024 * 1024)))
+
+
+class Rejected(Exception):
+    """A request turned away before any work was done; `status` is the HTTP status to answer with."""
+
+    def __init__(self, status: int, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+        self.retry_after = retry_after
+
+    def headers(self) -> dict:
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+class AdmissionQueue:
+    """Bounded queue in front of a fixed number of work slots.
+
+    Requests beyond the queue's capacity, or that can't get a slot within `max_wait`,
+    are rejected at once rather than piling up behind the ones already admitted.
+    """
+
+    def __init__(self, slots: int = MAX_CONCURRENT, max_queued: int = MAX_QUEUED, max_wait: float = MAX_QUEUE_WAIT):
+        self.slots = slots
+        self.max_queued = max_queued
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiting = 0
+        self._free = asyncio.Semaphore(slots)
+        self._hold_time = 5.0  # moving average of how long a slot is held, for Retry-After
+
+    def retry_after(self) -> float:
+        """Rough time until a newly queued request would get a slot."""
+        return self._hold_time * (self.waiting + 1) / self.slots
+
+    async def acquire(self) -> float:
+        """Wait for a slot; returns the time it was granted, to pass to release()."""
+        if self.active + self.waiting >= self.slots + self.max_queued:
+            raise Rejected(503, "Server is busy, try again later", self.retry_after())
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._free.acquire(), self.max_wait)
+        except asyncio.TimeoutError:
+            raise Rejected(503, "Timed out waiting for a free slot, try again later", self.retry_after()) from None
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        return time.monotonic()
+
+    def release(self, started: float) -> None:
+        self.active -= 1
+        self._hold_time += 0.1 * (time.monotonic() - started - self._hold_time)
+        self._free.release()
+
+
+class ClientLimiter:
+    """Per-client token buckets, keeping the most recently seen MAX_CLIENTS clients."""
+
+    def __init__(self, rpm: float = CLIENT_RPM, burst: float = CLIENT_BURST):
+        self.rate = rpm / 60
+        self.burst = burst
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+
+    def check(self, client: str, tokens: float = 1.0) -> None:
+        """Take `tokens` from the client's bucket, or raise Rejected (429) if it is empty."""
+        if self.rate <= 0:
+            return
+        bucket = self._buckets.pop(client, None) or TokenBucket(self.rate, capacity=self.burst)
+        self._buckets[client] = bucket
+        if len(self._buckets) > MAX_CLIENTS:
+            self._buckets.popitem(last=False)
+        tokens = min(tokens, bucket.capacity)
+        if not bucket.try_acquire(tokens):
+            raise Rejected(429, "Too many requests, slow down", bucket.retry_after(tokens))
+
+
+def client_id(headers, peer: str | None) -> str:
+    if TRUST_PROXY and headers.get("x-forwarded-for"):
+        return headers["x-forwarded-for"].split(",")[0].strip()
+    return peer or "unknown"
+
+
+queue = AdmissionQueue()
+clients = ClientLimiter()
@@ -0,0 +1,134 @@
+import os, json, asyncio
+from collections import OrderedDict
+from typing import AsyncIterator, Iterable
+from .core import resolve_model, cached_answer, failure_result, DEFAULT_MODEL
+from .hedge import explain_error_auto, AUTO, AUTO_MODELS
+from .router import KNOWN_ROUTING
+from .fingerprint import fingerprint
+from .ratelimit import TokenBucket
+
+BATCH_CONCURRENCY = int(os.getenv("STACKEXPLAIN_BATCH_CONCURRENCY", "8"))
+# Upstream requests per minute allowed for each model (OpenRouter free models allow 20)
+MODEL_RPM = float(os.getenv("STACKEXPLAIN_MODEL_RPM", "20"))
+# Finished results kept to answer later duplicates in the same batch (older ones come from the result cache)
+FINISHED_MAX = 1024
+
+_limiters: dict[str, TokenBucket] = {}
+
+
+def model_limiter(model: str) -> TokenBucket:
+    """The shared per-model rate limiter for upstream calls."""
+    if model not in _limiters:
+        _limiters[model] = TokenBucket(MODEL_RPM / 60, capacity=max(1.0, MODEL_RPM / 6))
+    return _limiters[model]
+
+
+def parse_item(line: str, index: int, default_model: str = DEFAULT_MODEL, force_llm: bool = False) -> dict | None:
+    """Turn one JSONL line into {"id", "error", "model", "force_llm"}.
+
+    A line is either a JSON object with an "error" field (plus optional "id", "model" and "force_llm")
+    or a bare JSON string. Items without an id are numbered by position. Returns None for
+    blank lines.
+    """
+    line = line.strip()
+    if not line:
+        return None
+    item = json.loads(line)
+    if isinstance(item, str):
+        item = {"error": item}
+    return {
+        "id": str(item.get("id", index)),
+        "error": item["error"],
+        "model": resolve_model(item.get("model") or default_model),
+        "force_llm": bool(item.get("force_llm", force_llm)),
+    }
+
+
+def read_checkpoint(path: str | None) -> set[str]:
+    """Ids already completed by a previous run."""
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+async def explain_batch(items: Iterable[dict], concurrency: int = BATCH_CONCURRENCY,
+                        skip_ids: set[str] | None = None) -> AsyncIterator[dict]:
+    """Explain many errors concurrently, yielding {"id", "model", "fingerprint", "result"} as each finishes.
+
+    Items with the same fingerprint, model and force_llm are explained once and the result is
+    reported for each of their ids; if explaining fails, each of them gets a failure
+    result (see core.is_failure). Items whose id is in skip_ids are skipped. Reading
+    from `items` pauses while `concurrency` explanations are running, so large inputs
+    don't pile up in memory.
+    """
+    skip_ids = skip_ids or set()
+    sem = asyncio.Semaphore(concurrency)
+    out: asyncio.Queue = asyncio.Queue()
+    waiting: dict[tuple[str, str, bool], list[str]] = {}
+    finished: OrderedDict[tuple[str, str, bool], dict] = OrderedDict()
+    _DONE = object()
+
+    def record(item_id: str, key: tuple[str, str, bool], result: dict) -> dict:
+        return {"id": item_id, "model": key[1], "fingerprint": key[0], "result": result}
+
+    async def work(key: tuple[str, str, bool], error: str) -> None:
+        _, model, force_llm = key
+        try:
+            # Known and cached answers don't use up any model's rate limit
+            result = cached_answer(error, AUTO_MODELS if model == AUTO else [model], force_llm=force_llm)
+            if result is not None and model == AUTO:
+                result = {**result, "routing": KNOWN_ROUTING}
+            elif result is None and model == AUTO:
+                # Each model the race actually calls waits for its own limiter
+                result = await explain_error_auto(error, model_to_use=AUTO, force_llm=force_llm, lookup=False,
+                                                  limit=lambda m: model_limiter(m).acquire())
+            elif result is None:
+                await model_limiter(model).acquire()
+                result = await explain_error_auto(error, model_to_use=model, force_llm=force_llm, lookup=False)
+        except Exception as e:
+            # Report it for every waiting id rather than abort the batch
+            result = failure_result(e)
+        finally:
+            sem.release()
+        finished[key] = result
+        if len(finished) > FINISHED_MAX:
+            finished.popitem(last=False)
+        for item_id in waiting.pop(key):
+            out.put_nowait(record(item_id, key, result))
+
+    async def feed() -> None:
+        tasks = set()
+        try:
+            for item in items:
+                if item is None or item["id"] in skip_ids:
+                    continue
+                key = (fingerprint(item["error"]), item["model"], item.get("force_llm", False))
+                if key in finished:
+                    finished.move_to_end(key)
+                    out.put_nowait(record(item["id"], key, finished[key]))
+                elif key in waiting:
+                    waiting[key].append(item["id"])
+                else:
+                    waiting[key] = [item["id"]]
+                    await sem.acquire()
+                    task = asyncio.create_task(work(key, item["error"]))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                # Let finished work flush out between items
+                await asyncio.sleep(0)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            out.put_nowait(_DONE)
+
+    feeder = asyncio.create_task(feed())
+    try:
+        while True:
+            rec = await out.get()
+            if rec is _DONE:
+                break
+            yield rec
+        await feeder
+    finally:
+        feeder.cancel()
@@ -0,0 +1,203 @@
+import os, json, time, sqlite3, threading
+from collections import OrderedDict
+
+# Where on-disk caches live; shared by the CLI and the API server
+CACHE_DIR = os.path.expanduser(os.getenv("STACKEXPLAIN_CACHE_DIR", "~/.cache/stackexplain"))
+
+LINK_CACHE_GOOD_TTL = float(os.getenv("STACKEXPLAIN_LINK_CACHE_GOOD_TTL", str(7 * 24 * 3600)))
+LINK_CACHE_BAD_TTL = float(os.getenv("STACKEXPLAIN_LINK_CACHE_BAD_TTL", str(6 * 3600)))
+LINK_CACHE_MAX_ENTRIES = int(os.getenv("STACKEXPLAIN_LINK_CACHE_MAX_ENTRIES", "10000"))
+
+RESULT_CACHE_TTL = float(os.getenv("STACKEXPLAIN_RESULT_CACHE_TTL", str(7 * 24 * 3600)))
+RESULT_CACHE_MEMORY_ENTRIES = int(os.getenv("STACKEXPLAIN_RESULT_CACHE_MEMORY_ENTRIES", "1024"))
+RESULT_CACHE_DISK_ENTRIES = int(os.getenv("STACKEXPLAIN_RESULT_CACHE_DISK_ENTRIES", "50000"))
+RESULT_CACHE_PERSIST = os.getenv("STACKEXPLAIN_RESULT_CACHE_PERSIST", "1") == "1"
+# On-disk tables are pruned (expired rows, size limit) once every this many writes, not on each one
+PRUNE_EVERY = int(os.getenv("STACKEXPLAIN_CACHE_PRUNE_EVERY", "100"))
+
+
+def _connect(filename: str) -> sqlite3.Connection:
+    """Open a SQLite database in CACHE_DIR, falling back to memory if the disk isn't usable."""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        conn = sqlite3.connect(os.path.join(CACHE_DIR, filename), check_same_thread=False, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+    except (sqlite3.Error, OSError):
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+    return conn
+
+
+class LinkCache:
+    """Remembers whether a URL passed verification, with separate TTLs for good and bad results."""
+
+    def __init__(self, filename: str = "links.sqlite3", good_ttl: float = LINK_CACHE_GOOD_TTL,
+                 bad_ttl: float = LINK_CACHE_BAD_TTL, max_entries: int = LINK_CACHE_MAX_ENTRIES):
+        self.good_ttl = good_ttl
+        self.bad_ttl = bad_ttl
+        self.max_entries = max_entries
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = _connect(filename)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS links (url TEXT PRIMARY KEY, ok INTEGER NOT NULL, checked_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS links_checked_at ON links (checked_at)")
+        self._conn.commit()
+
+    def get(self, url: str) -> bool | None:
+        """Return the cached verdict for a URL, or None if unknown or expired."""
+        with self._lock:
+            row = self._conn.execute("SELECT ok, checked_at FROM links WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        ok, checked_at = bool(row[0]), row[1]
+        ttl = self.good_ttl if ok else self.bad_ttl
+        if time.time() - checked_at > ttl:
+            return None
+        return ok
+
+    def set(self, url: str, ok: bool) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO links (url, ok, checked_at) VALUES (?, ?, ?)",
+                (url, int(ok), time.time()),
+            )
+            self._writes += 1
+            if self._writes % PRUNE_EVERY == 0:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        # Drop the oldest entries once the table grows past max_entries
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM links").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM links WHERE url IN (SELECT url FROM links ORDER BY checked_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM links")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM links").fetchone()
+        return count
+
+
+class ExplanationCache:
+    """Caches explain_error results by (error fingerprint, model).
+
+    Lookups go to an in-memory LRU first and then, if persist is enabled, to a SQLite
+    table shared with other processes. Entries older than ttl are ignored and evicted; the
+    table is pruned every PRUNE_EVERY writes, so it can run that many rows over disk_entries.
+    """
+
+    def __init__(self, filename: str = "explanations.sqlite3", ttl: float = RESULT_CACHE_TTL,
+                 memory_entries: int = RESULT_CACHE_MEMORY_ENTRIES, disk_entries: int = RESULT_CACHE_DISK_ENTRIES,
+                 persist: bool = RESULT_CACHE_PERSIST):
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[tuple[str, str], tuple[float, dict]] = OrderedDict()
+        self._conn = None
+        if persist:
+            self._conn = _connect(filename)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS explanations ("
+                "fingerprint TEXT NOT NULL, model TEXT NOT NULL, result TEXT NOT NULL, stored_at REAL NOT NULL, "
+                "PRIMARY KEY (fingerprint, model))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS explanations_stored_at ON explanations (stored_at)")
+            self._conn.commit()
+
+    def get(self, fingerprint: str, model: str) -> dict | None:
+        with self._lock:
+            result, from_disk = self._lookup((fingerprint, model))
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.disk_hits += from_disk
+            return result
+
+    def peek(self, fingerprint: str, model: str) -> dict | None:
+        """Like get, but not counted in the hit and miss stats (for lookups that aren't cache lookups)."""
+        with self._lock:
+            return self._lookup((fingerprint, model))[0]
+
+    def _lookup(self, key: tuple[str, str]) -> tuple[dict | None, bool]:
+        # (result, whether it came from disk); the caller holds the lock
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None and now - entry[0] <= self.ttl:
+            self._memory.move_to_end(key)
+            return dict(entry[1]), False
+        if entry is not None:
+            del self._memory[key]
+        if self._conn is not None:
+            row = self._conn.execute(
+                "SELECT result, stored_at FROM explanations WHERE fingerprint = ? AND model = ?", key
+            ).fetchone()
+            if row is not None and now - row[1] <= self.ttl:
+                result = json.loads(row[0])
+                self._remember(key, row[1], result)
+                return dict(result), True
+        return None, False
+
+    def set(self, fingerprint: str, model: str, result: dict, persist: bool = True) -> None:
+        """Store a result; with persist=False only the in-memory LRU is updated."""
+        key = (fingerprint, model)
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, dict(result))
+            if self._conn is not None and persist:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO explanations (fingerprint, model, result, stored_at) VALUES (?, ?, ?, ?)",
+                    (fingerprint, model, json.dumps(result), now),
+                )
+                self._writes += 1
+                if self._writes % PRUNE_EVERY == 0:
+                    self._prune(now)
+                self._conn.commit()
+
+    def _prune(self, now: float) -> None:
+        self._conn.execute("DELETE FROM explanations WHERE stored_at < ?", (now - self.ttl,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM explanations").fetchone()
+        if count > self.disk_entries:
+            self._conn.execute(
+                "DELETE FROM explanations WHERE rowid IN "
+                "(SELECT rowid FROM explanations ORDER BY stored_at LIMIT ?)",
+                (count - self.disk_entries,),
+            )
+
+    def _remember(self, key: tuple[str, str], stored_at: float, result: dict) -> None:
+        self._memory[key] = (stored_at, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM explanations")
+                self._conn.commit()
@@ -0,0 +1,222 @@
+import os, re
+from dataclasses import dataclass, field
+
+# Token budget for the error text in the prompt, by model family (matched as a substring of the model id)
+ERROR_TOKEN_BUDGETS = {
+    "deepseek": 4000,
+    "gemini": 6000,
+    "mistral": 3000,
+}
+DEFAULT_ERROR_TOKEN_BUDGET = int(os.getenv("STACKEXPLAIN_ERROR_TOKEN_BUDGET", "3000"))
+MAX_LINE_CHARS = 400
+
+_PY_FRAME = re.compile(r'^\s*File "[^"]*", line \d+')
+_AT_FRAME = re.compile(r"^\s+at\s")
+_PY_REPEATED = re.compile(r"^\s*\[Previous line repeated (\d+) more times?\]")
+# Frames from libraries, runtimes and frameworks rather than the user's own code
+_NOISE = re.compile(
+    r"site-packages|dist-packages|<frozen |/lib/python\d|\\lib\\|node_modules|node:internal|"
+    r"at (?:java\.base/|java\.|javax\.|jdk\.|sun\.|com\.sun\.|org\.springframework\.|org\.apache\.|"
+    r"org\.hibernate\.|io\.netty\.|reactor\.|kotlin\.|scala\.)|"
+    r"\((?:Native Method|Unknown Source)\)|processTicksAndRejections|asyncio[/\\]"
+)
+_LINE_NUMBERS = re.compile(r"(?<=line )\d+|(?<=:)\d+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token for code and English)."""
+    return (len(text) + 3) // 4
+
+
+def error_token_budget(model: str) -> int:
+    model = model.lower()
+    for family, budget in ERROR_TOKEN_BUDGETS.items():
+        if family in model:
+            return budget
+    return DEFAULT_ERROR_TOKEN_BUDGET
+
+
+@dataclass
+class Compaction:
+    text: str
+    original_tokens: int
+    tokens: int
+    elided: list[str] = field(default_factory=list)
+
+
+@dataclass
+class _Unit:
+    lines: list[str]
+    frame: bool
+    repeat: int = 0  # times this frame was repeated immediately after itself
+    omitted: int = 0  # set on placeholders standing in for frames that were cut
+
+    @property
+    def noise(self) -> bool:
+        return self.frame and not self.omitted and _NOISE.search(self.lines[0]) is not None
+
+    @property
+    def weight(self) -> int:
+        """How many original frames this unit stands for."""
+        return self.omitted or 1
+
+    def render(self) -> list[str]:
+        if not self.repeat:
+            return self.lines
+        indent = self.lines[0][: len(self.lines[0]) - len(self.lines[0].lstrip())]
+        return self.lines + [f"{indent}[previous frame repeated {self.repeat} more times]"]
+
+
+def _units(lines: list[str]) -> list[_Unit]:
+    """Group lines into stack frames (a Python frame includes its indented source lines) and other text."""
+    units: list[_Unit] = []
+    for line in lines:
+        if _PY_FRAME.match(line) or _AT_FRAME.match(line):
+            units.append(_Unit([line], True))
+        elif (units and units[-1].frame and _PY_FRAME.match(units[-1].lines[0])
+              and len(line) - len(line.lstrip()) > len(units[-1].lines[0]) - len(units[-1].lines[0].lstrip())):
+            units[-1].lines.append(line)
+        else:
+            units.append(_Unit([line], False))
+    return units
+
+
+def _collapse_repeats(units: list[_Unit]) -> int:
+    """Fold runs of identical frames (recursion) into one frame with a repeat count, in place."""
+    collapsed = 0
+    out: list[_Unit] = []
+    for unit in units:
+        match = _PY_REPEATED.match(unit.lines[0]) if not unit.frame else None
+        if match and out and out[-1].frame:
+            out[-1].repeat += int(match.group(1))
+            collapsed += int(match.group(1))
+            continue
+        if unit.frame and out and out[-1].frame and _same_frame(out[-1], unit):
+            out[-1].repeat += 1
+            collapsed += 1
+            continue
+        out.append(unit)
+    units[:] = out
+    return collapsed
+
+
+def _same_frame(a: _Unit, b: _Unit) -> bool:
+    return [_LINE_NUMBERS.sub("N", x) for x in a.lines] == [_LINE_NUMBERS.sub("N", x) for x in b.lines]
+
+
+def _segments(units: list[_Unit]) -> list[tuple[int, int]]:
+    """(start, end) index ranges of consecutive frames."""
+    spans, start = [], None
+    for i, unit in enumerate(units + [_Unit([], False)]):
+        if unit.frame and start is None:
+            start = i
+        elif not unit.frame and start is not None:
+            spans.append((start, i))
+            start = None
+    return spans
+
+
+def _marker(like: _Unit, count: int, what: str) -> _Unit:
+    indent = like.lines[0][: len(like.lines[0]) - len(like.lines[0].lstrip())]
+    return _Unit([f"{indent}[... {count} {what} omitted ...]"], True, omitted=count)
+
+
+def _thin(units: list[_Unit], wanted, what: str) -> int:
+    """Replace each run of frames not picked by wanted(frames) with a single placeholder."""
+    dropped = 0
+    for start, end in reversed(_segments(units)):
+        frames = units[start:end]
+        keep = wanted(frames)
+        if len(keep) >= len(frames):
+            continue
+        kept, gap = [], 0
+        for i, unit in enumerate(frames):
+            if i in keep:
+                if gap:
+                    kept.append(_marker(unit, gap, what))
+                    gap = 0
+                kept.append(unit)
+            else:
+                dropped += 0 if unit.omitted else 1
+                gap += unit.weight
+        if gap:
+            kept.append(_marker(frames[-1], gap, what))
+        units[start:end] = kept
+    return dropped
+
+
+def _user_frames(frames: list[_Unit]) -> list[int]:
+    return [i for i, f in enumerate(frames) if not f.omitted and not f.noise]
+
+
+def _drop_noise(units: list[_Unit]) -> int:
+    """Remove library/framework frames, keeping the outermost and innermost frame of each stack."""
+    return _thin(
+        units,
+        lambda frames: set(_user_frames(frames)) | {0, len(frames) - 1},
+        "library frames",
+    )
+
+
+def _keep_ends(units: list[_Unit], keep: int) -> int:
+    """Keep the first and last `keep` frames of each stack plus its first and last user frames."""
+    def wanted(frames):
+        user = _user_frames(frames)
+        return set(range(keep)) | set(range(len(frames) - keep, len(frames))) | set(user[:1] + user[-1:])
+    return _thin(units, wanted, "frames")
+
+
+def _render(units: list[_Unit]) -> str:
+    return "\n".join(line for unit in units for line in unit.render())
+
+
+def compact_error(error: str, budget_tokens: int) -> Compaction:
+    """Shrink an error/stack trace to fit within budget_tokens.
+
+    Exception lines and "caused by" chains are kept. Steps run in order until the text
+    fits: recursive frames are collapsed into counts, library and framework frames are
+    dropped, the middle of each stack is cut down to its first and last frames, long
+    lines are shortened, and as a last resort the middle of the text is cut. Each step
+    that removes something is recorded in `elided`.
+    """
+    original_tokens = estimate_tokens(error)
+    if original_tokens <= budget_tokens:
+        return Compaction(error, original_tokens, original_tokens)
+
+    elided = []
+    units = _units(error.splitlines())
+    text = error
+
+    steps = [
+        (_collapse_repeats, "{} repeated frames"),
+        (_drop_noise, "{} library/framework frames"),
+        (lambda u: _keep_ends(u, 3), "{} middle frames"),
+        (lambda u: _keep_ends(u, 1), "{} more middle frames"),
+    ]
+    for step, label in steps:
+        removed = step(units)
+        if removed:
+            elided.append(label.format(removed))
+            text = _render(units)
+            if estimate_tokens(text) <= budget_tokens:
+                break
+
+    if estimate_tokens(text) > budget_tokens:
+        lines, shortened = [], 0
+        for line in text.splitlines():
+            if len(line) > MAX_LINE_CHARS:
+                line = line[:MAX_LINE_CHARS] + " [...]"
+                shortened += 1
+            lines.append(line)
+        if shortened:
+            elided.append(f"{shortened} long lines shortened")
+            text = "\n".join(lines)
+
+    if estimate_tokens(text) > budget_tokens:
+        # Keep the start (where the trace begins) and the end (where the exception usually is)
+        keep_chars = budget_tokens * 4 - 64
+        head, tail = text[: keep_chars // 3], text[-(keep_chars - keep_chars // 3):]
+        elided.append(f"{len(text) - len(head) - len(tail)} characters from the middle")
+        text = head + "\n[... middle of the error omitted ...]\n" + tail
+
+    return Compaction(text, original_tokens, estimate_tokens(text), elided)
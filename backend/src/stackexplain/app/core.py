@@ -1,172 +1,504 @@
-from openai import OpenAI, InternalServerError
-import os, json, re, time
-from dotenv import load_dotenv
-from urllib.parse import quote
-import requests
-from bs4 import BeautifulSoup
-
-load_dotenv()
+import os, sys, time, asyncio
+from .links import verify_link, verify_link_async, clean_links, clean_links_async
+from .docs import doc_links
+from .cache import ExplanationCache
+from .similar import SimilarityIndex
+from .fingerprint import fingerprint
+from .singleflight import SingleFlight
+from .streaming import IncrementalFieldParser
+from .prompts import build_prompt, build_messages, RESPONSE_FORMAT
+from .repair import parse_json_lenient, parse_stats
+from .signatures import default_index
+from .latency import LatencyTracker
+from .health import breaker, classify, max_attempts, backoff_delay, CircuitOpenError, RETRYABLE
+from .models import MODEL_MAP, DEFAULT_MODEL, resolve_model
+from .router import router
+from . import metrics
+from .metrics import timed, record_stage
+
 api_key = os.getenv("OPENROUTER_API_KEY")
-client = OpenAI(base_url="https://openrouter.ai/api/v1", api_key=api_key)
-
-import json
-
-# "mistralai/mistral-small-3.2-24b-instruct:free"
-
-def build_prompt(error: str, model_to_use="deepseek/deepseek-chat-v3-0324:free") -> str:
-    examples = [
-        {
-            "language": "Python",
-            "input": "IndexError: list index out of range",
-            "output": {
-                "error_type": "IndexError",
-                "explanation": "You tried to access a position in a list that doesn't exist.",
-                "suggested_fix": "Make sure your index is within the bounds of the list (0 to len(list)-1).",
-                "relevant_links": [
-                    "https://docs.python.org/3/library/exceptions.html#IndexError"
-                ]
-            }
-        },
-        {
-            "language": "JavaScript",
-            "input": "TypeError: undefined is not a function",
-            "output": {
-                "error_type": "TypeError",
-                "explanation": "You're trying to call something that isn't defined as a function.",
-                "suggested_fix": "Check if the variable you're calling is actually assigned to a function.",
-                "relevant_links": [
-                    "https://developer.mozilla.org/en-US/docs/Web/JavaScript/Reference/Errors/Not_a_function"
-                ]
-            }
-        },
-        {
-            "language": "Java",
-            "input": "NullPointerException",
-            "output": {
-                "error_type": "NullPointerException",
-                "explanation": "You're trying to use an object reference that is null.",
-                "suggested_fix": "Check if the object is null before calling methods or accessing fields on it.",
-                "relevant_links": [
-                    "https://docs.oracle.com/javase/8/docs/api/java/lang/NullPointerException.html"
-                ]
-            }
-        }
-    ]
-
-    few_shot_block = ""
-    for ex in examples:
-        few_shot_block += f"""Example:
-This is a {ex["language"]} error.
-
-Input:
-{ex["input"]}
-
-Output:
-{json.dumps(ex["output"], indent=2)}
-
-"""
-
-    instruction_block = """You are an expert multilingual debugging assistant.
-
-Your task is to analyze code error messages from various programming languages (like Python, JavaScript, Java, etc.), explain what causes them, suggest a fix, and provide up to 3 helpful documentation links.
-
-Always respond with a raw JSON object in the following format (no markdown, no code blocks):
-
-{
-  "error_type": "...",
-  "explanation": "...",
-  "suggested_fix": "...",
-  "relevant_links": ["...", "...", "..."]
-}
-
-Think step-by-step if needed, but only output the final JSON.
-
-"""
-
-    query_block = f"""Now explain this error:
-
-Input:
-{error}
-"""
-
-    # Use few-shot prompting only for DeepSeek or Gemini
-    if any(keyword in model_to_use.lower() for keyword in ["deepseek", "gemini"]):
-        return instruction_block + few_shot_block + query_block
-    else:
-        return instruction_block + query_block
-
-
-def verify_link(url: str, max_title_len: int = 100) -> bool:
-    """Check if a link is reachable and has a reasonable HTML title."""
+# Any OpenAI-compatible endpoint works (the benchmarks point this at a local stub)
+BASE_URL = os.getenv("STACKEXPLAIN_BASE_URL", "https://openrouter.ai/api/v1")
+
+# OpenAI clients, created on first use: answers from signatures or the cache never load the SDK
+client = None
+async_client = None
+
+
+def _client_args() -> dict:
+    from . import transport
+    import httpx
+    # Model calls are bounded by the admission queue, not the per-host limit meant for docs sites
+    transport.exempt_host(httpx.URL(BASE_URL).host)
+    # Retries are handled by explain_error itself (see health.py), so the SDK's own are disabled
+    return {"base_url": BASE_URL, "api_key": api_key, "max_retries": 0,
+            "timeout": transport.timeout(transport.LLM_TIMEOUT)}
+
+
+def get_client():
+    """The blocking OpenAI client, on the pooled connections shared with the link checker."""
+    global client
+    if client is None:
+        with timed("setup"):
+            from openai import OpenAI
+            from . import transport
+            client = OpenAI(http_client=transport.sync_client(), **_client_args())
+    return client
+
+
+def get_async_client():
+    global async_client
+    if async_client is None:
+        with timed("setup"):
+            from openai import AsyncOpenAI
+            from . import transport
+            async_client = AsyncOpenAI(http_client=transport.async_client(), **_client_args())
+    return async_client
+
+# Previously computed explanations, keyed on (error fingerprint, model)
+result_cache = ExplanationCache()
+# The same explanations, found by how closely the error text matches rather than its exact fingerprint
+similar_index = SimilarityIndex()
+# Recent completion latencies per model
+model_latency = LatencyTracker()
+# Canned answers for common, textbook errors, checked before going to the network
+signature_index = default_index()
+# Identical explanations that are currently being computed, so concurrent duplicates share one upstream call
+inflight = SingleFlight()
+
+# Token usage summed over all completions, including how much of the prompt the provider served from cache
+usage_totals = {"completions": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+
+
+def record_usage(usage) -> None:
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    usage_totals["completions"] += 1
+    usage_totals["prompt_tokens"] += usage.prompt_tokens or 0
+    usage_totals["completion_tokens"] += usage.completion_tokens or 0
+    usage_totals["cached_tokens"] += (getattr(details, "cached_tokens", None) or 0) if details else 0
+    metrics.tokens.inc(usage.prompt_tokens or 0, type="prompt")
+    metrics.tokens.inc(usage.completion_tokens or 0, type="completion")
+    metrics.tokens.inc((getattr(details, "cached_tokens", None) or 0) if details else 0, type="cached")
+
+
+def _record_call(model: str, started: float, outcome: str) -> None:
+    """Account for one model call: its stage time, outcome, and latency if it succeeded."""
+    seconds = time.monotonic() - started
+    record_stage("model", seconds)
+    metrics.model_requests.inc(model=model, outcome=outcome)
+    if outcome == "success":
+        metrics.model_latency.observe(seconds, model=model)
+
+
+# Ask for schema-constrained JSON; a model whose provider rejects that falls back to plain prompting
+STRUCTURED_OUTPUT = os.getenv("STACKEXPLAIN_STRUCTURED_OUTPUT", "1") != "0"
+_unstructured_models: set[str] = set()
+
+
+def _completion_args(model_to_use: str, messages: list[dict]) -> dict:
+    args = {"model": model_to_use, "messages": messages}
+    if STRUCTURED_OUTPUT and model_to_use not in _unstructured_models:
+        args["response_format"] = RESPONSE_FORMAT
+    return args
+
+
+def _structured_unsupported(args: dict, e: Exception) -> bool:
+    """True (and remembered) if the request failed because the provider rejected response_format."""
+    from openai import BadRequestError
+    if "response_format" in args and isinstance(e, BadRequestError):
+        _unstructured_models.add(args["model"])
+        return True
+    return False
+
+
+def _parse_content(content: str) -> dict:
+    """Parse a completion as JSON, repairing fences, surrounding prose, trailing commas and truncation."""
+    data, _ = parse_json_lenient(content or "")
+    if not any(field in data for field in ("error_type", "explanation", "suggested_fix")):
+        raise ValueError("The model's answer has none of the expected fields")
+    return data
+
+
+def _result(data: dict, links: list[str]) -> dict:
+    return {
+        "error_type": data.get("error_type", "UnknownError"),
+        "explanation": data.get("explanation", "No explanation available."),
+        "suggested_fix": data.get("suggested_fix", "No fix available."),
+        "relevant_links": links,
+    }
+
+
+def _model_unavailable() -> dict:
+    return {
+        "error_type": "ModelUnavailable",
+        "explanation": "Model temporarily unavailable—try again later.",
+        "suggested_fix": "",
+        "relevant_links": ["https://openrouter.ai/docs"]
+    }
+
+
+def _internal_error(e: Exception) -> dict:
+    return {
+        "error_type": "InternalError",
+        "explanation": "Internal error occurred.",
+        "suggested_fix": str(e),
+        "relevant_links": []
+    }
+
+
+def is_failure(result: dict) -> bool:
+    """True for the stand-in results returned when no explanation could be had (see failure_result)."""
+    return result["error_type"] in ("ModelUnavailable", "InternalError")
+
+
+def _cacheable(result: dict) -> bool:
+    return not is_failure(result)
+
+
+def remember(error_msg: str, key: str, model: str, result: dict) -> None:
+    """Cache a model's answer, by fingerprint and for near-duplicate lookups."""
+    result_cache.set(key, model, result)
+    similar_index.add(error_msg, key, model)
+
+
+async def remember_async(error_msg: str, key: str, model: str, result: dict) -> None:
+    """remember, with the SQLite writes done off the event loop."""
+    await asyncio.to_thread(remember, error_msg, key, model, result)
+
+
+def cached_answer(error_msg: str, models: list[str], use_cache: bool = True, force_llm: bool = False) -> dict | None:
+    """A canned (signature), previously cached or near-duplicate answer for any of `models`, without calling a model."""
+    if not force_llm:
+        with timed("signature"):
+            known = signature_index.match(error_msg)
+        if known is not None:
+            return known
+    if use_cache:
+        key = fingerprint(error_msg)
+        with timed("cache"):
+            for model in models:
+                cached = result_cache.get(key, model)
+                if cached is not None:
+                    return cached
+        with timed("similar"):
+            similar = similar_index.match(error_msg, models, result_cache.peek)
+        if similar is not None:
+            result, model, _ = similar
+            # Memory only: this can run on the event loop, and the near-duplicate is found again on disk anyway
+            result_cache.set(key, model, result, persist=False)
+            return result
+    return None
+
+
+def explain_error(error_msg: str, model_to_use: str = "deepseek/deepseek-chat-v3-0324:free", retries: int = 3,
+                  use_cache: bool = True, force_llm: bool = False) -> dict:
+    known = cached_answer(error_msg, [model_to_use], use_cache, force_llm)
+    if known is not None:
+        return known
+    key = fingerprint(error_msg)
+    result = _explain_uncached(error_msg, model_to_use, retries)
+    if use_cache and _cacheable(result):
+        remember(error_msg, key, model_to_use, result)
+    return result
+
+
+async def explain_error_async(error_msg: str, model_to_use: str = "deepseek/deepseek-chat-v3-0324:free", retries: int = 3,
+                              use_cache: bool = True, force_llm: bool = False, lookup: bool = True) -> dict:
+    """Async version of explain_error for use inside an event loop (e.g. FastAPI).
+
+    Pass lookup=False if cached_answer has already come up empty for this error.
+    """
+    known = cached_answer(error_msg, [model_to_use], use_cache, force_llm) if lookup else None
+    if known is not None:
+        return known
+    key = fingerprint(error_msg)
+
+    async def compute() -> dict:
+        result = await _explain_uncached_async(error_msg, model_to_use, retries)
+        if use_cache and _cacheable(result):
+            await remember_async(error_msg, key, model_to_use, result)
+        return result
+
+    if not use_cache:
+        return await compute()
+    return await inflight.do((key, model_to_use), compute)
+
+
+def _fetch_data(error_msg: str, model_to_use: str, retries: int) -> dict:
+    """Ask the model and parse its JSON answer. Raises the last error if every attempt fails.
+
+    Transient failures are retried with jittered backoff, malformed answers once, and
+    hard errors not at all. Raises CircuitOpenError without calling the model while its
+    circuit breaker is open.
+    """
+    with timed("prompt"):
+        messages = build_messages(error_msg, model_to_use=model_to_use)
+    health = breaker(model_to_use)
+    attempt = 0
+    while True:
+        probe = health.check()
+        args = _completion_args(model_to_use, messages)
+        llm = get_client()
+        try:
+            started = time.monotonic()
+            try:
+                resp = llm.chat.completions.create(**args)
+            except Exception as e:
+                _record_call(model_to_use, started, classify(e))
+                raise
+            _record_call(model_to_use, started, "success")
+            health.record_success(probe)
+            record_usage(resp.usage)
+            with timed("parse"):
+                data = _parse_content(resp.choices[0].message.content)
+            model_latency.record(model_to_use, time.monotonic() - started)
+            router.record(model_to_use, error_msg, True, time.monotonic() - started)
+            return data
+        except Exception as e:
+            if _structured_unsupported(args, e):
+                continue
+            router.record(model_to_use, error_msg, False)
+            kind = classify(e)
+            if kind == RETRYABLE:
+                health.record_failure(probe)
+            attempt += 1
+            if attempt >= max_attempts(kind, retries):
+                raise
+            metrics.retries.inc(model=model_to_use, kind=kind)
+            with timed("backoff"):
+                time.sleep(backoff_delay(attempt - 1, e))
+        finally:
+            health.release(probe)
+
+
+async def _fetch_data_async(error_msg: str, model_to_use: str, retries: int) -> dict:
+    with timed("prompt"):
+        messages = build_messages(error_msg, model_to_use=model_to_use)
+    health = breaker(model_to_use)
+    attempt = 0
+    while True:
+        probe = health.check()
+        args = _completion_args(model_to_use, messages)
+        llm = get_async_client()
+        try:
+            started = time.monotonic()
+            try:
+                resp = await llm.chat.completions.create(**args)
+            except Exception as e:
+                _record_call(model_to_use, started, classify(e))
+                raise
+            _record_call(model_to_use, started, "success")
+            health.record_success(probe)
+            record_usage(resp.usage)
+            with timed("parse"):
+                data = _parse_content(resp.choices[0].message.content)
+            model_latency.record(model_to_use, time.monotonic() - started)
+            router.record(model_to_use, error_msg, True, time.monotonic() - started)
+            return data
+        except Exception as e:
+            if _structured_unsupported(args, e):
+                continue
+            router.record(model_to_use, error_msg, False)
+            kind = classify(e)
+            if kind == RETRYABLE:
+                health.record_failure(probe)
+            attempt += 1
+            if attempt >= max_attempts(kind, retries):
+                raise
+            metrics.retries.inc(model=model_to_use, kind=kind)
+            with timed("backoff"):
+                await asyncio.sleep(backoff_delay(attempt - 1, e))
+        finally:
+            health.release(probe)
+
+
+def failure_result(e: Exception) -> dict:
+    """The result reported in place of an explanation when getting one failed with `e`."""
+    from openai import InternalServerError
+    if isinstance(e, (InternalServerError, CircuitOpenError)):
+        return _model_unavailable()
+    return _internal_error(e)
+
+
+def healthy_alternative(model_to_use: str) -> str | None:
+    """Another known model whose circuit breaker would currently let a request through."""
+    for model in MODEL_MAP.values():
+        if model != model_to_use and breaker(model).available():
+            return model
+    return None
+
+
+def _explain_uncached(error_msg: str, model_to_use: str, retries: int) -> dict:
     try:
-        resp = requests.get(url, timeout=5)
-        resp.raise_for_status()
-        soup = BeautifulSoup(resp.text, "html.parser")
-        title = soup.title.string if soup.title else ""
-        # Check title exists and isn't nonsense or empty
-        if title and len(title) <= max_title_len:
-            return True
-        return False
+        try:
+            data = _fetch_data(error_msg, model_to_use, retries)
+        except CircuitOpenError:
+            # Fail over instead of waiting for the model to recover
+            alternative = healthy_alternative(model_to_use)
+            if alternative is None:
+                raise
+            data = _fetch_data(error_msg, alternative, retries)
     except Exception as e:
-        # print(e)
-        return False
+        return failure_result(e)
+    with timed("links"):
+        links = clean_links(data.get("relevant_links", []),
+                            fallback=doc_links(data.get("error_type"), error_msg))
+    return _result(data, links)
 
-def clean_links(links: list[str], max_len: int = 200) -> list[str]:
-    cleaned = []
-    for link in links:
-        if not isinstance(link, str):
-            continue
-        if len(link) > max_len:
-            continue  # too long
-        if any(bad in link for bad in ["duckduckgo.com", "google.com/search"]):
+
+async def _fetch_with_failover_async(error_msg: str, model_to_use: str, retries: int) -> dict:
+    """_fetch_data_async, moving to a healthy alternative if the model's circuit is open."""
+    try:
+        return await _fetch_data_async(error_msg, model_to_use, retries)
+    except CircuitOpenError:
+        alternative = healthy_alternative(model_to_use)
+        if alternative is None:
+            raise
+        return await _fetch_data_async(error_msg, alternative, retries)
+
+
+async def _explain_uncached_async(error_msg: str, model_to_use: str, retries: int) -> dict:
+    try:
+        data = await _fetch_with_failover_async(error_msg, model_to_use, retries)
+    except Exception as e:
+        return failure_result(e)
+    with timed("links"):
+        links = await clean_links_async(data.get("relevant_links", []),
+                                        fallback=doc_links(data.get("error_type"), error_msg))
+    return _result(data, links)
+
+
+TEXT_FIELDS = ("error_type", "explanation", "suggested_fix")
+
+
+def answer_events(result: dict) -> list[tuple[str, object]]:
+    """The stream events for an answer that is already complete."""
+    return [*((field, result[field]) for field in TEXT_FIELDS),
+            ("relevant_links", result["relevant_links"]), ("done", result)]
+
+
+async def explain_error_stream(error_msg: str, model_to_use: str = "deepseek/deepseek-chat-v3-0324:free",
+                               retries: int = 3, use_cache: bool = True, force_llm: bool = False, lookup: bool = True):
+    """Stream an explanation as (event, data) pairs.
+
+    Yields one event per text field (error_type, explanation, suggested_fix) as soon as the
+    model has finished writing it, then "relevant_links" once the links are verified, and
+    finally "done" with the complete result. Pass lookup=False if cached_answer has already
+    come up empty for this error.
+    """
+    key = fingerprint(error_msg)
+    cached = cached_answer(error_msg, [model_to_use], use_cache, force_llm) if lookup else None
+    if cached is not None:
+        for event in answer_events(cached):
+            yield event
+        return
+
+    model = model_to_use
+    with timed("prompt"):
+        messages = build_messages(error_msg, model_to_use=model)
+    health = breaker(model)
+    result = None
+    attempt = 0
+    while result is None:
+        parser = IncrementalFieldParser()
+        sent = set()
+        try:
+            probe = health.check()
+        except CircuitOpenError as e:
+            # Nothing has been sent yet, so fail over instead of waiting for the model to recover
+            alternative = healthy_alternative(model) if model == model_to_use else None
+            if alternative is None:
+                result = failure_result(e)
+                break
+            model, health = alternative, breaker(alternative)
+            with timed("prompt"):
+                messages = build_messages(error_msg, model_to_use=model)
             continue
-        # Verify the link is valid and relevant by checking if reachable and has a title
-        if verify_link(link):
-            cleaned.append(link)
-        else:
-            pass
-            # print(f"Discarded invalid/unreachable link: {link}")
-        if len(cleaned) >= 3:
-            break
-    return cleaned
-
-
-def explain_error(error_msg: str, model_to_use: str = "deepseek/deepseek-chat-v3-0324:free", retries: int = 3) -> dict:
-    prompt = build_prompt(error_msg, model_to_use=model_to_use)
-    for i in range(retries):
+        args = _completion_args(model, messages)
+        llm = get_async_client()
         try:
-            resp = client.chat.completions.create(
-                model=model_to_use,
-                messages=[{"role": "user", "content": prompt}],
-            )
-            content = resp.choices[0].message.content.strip()
-            if content.startswith("```"):
-                content = re.sub(r"^```(?:json)?", "", content).strip().rstrip("```").strip()
-            data = json.loads(content)
-            links = clean_links(data.get("relevant_links", []))
-            return {
-                "error_type": data.get("error_type", "UnknownError"),
-                "explanation": data.get("explanation", "No explanation available."),
-                "suggested_fix": data.get("suggested_fix", "No fix available."),
-                "relevant_links": links,
-            }
-        except InternalServerError:
-            if i < retries - 1:
-                time.sleep(2 ** i)
-                continue
-            return {
-                "error_type": "ModelUnavailable",
-                "explanation": "Model temporarily unavailable—try again later.",
-                "suggested_fix": "",
-                "relevant_links": ["https://openrouter.ai/docs"]
-            }
+            started = time.monotonic()
+            try:
+                stream = await llm.chat.completions.create(
+                    **args,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                )
+                async with stream:
+                    async for chunk in stream:
+                        if chunk.usage:
+                            record_usage(chunk.usage)
+                        if not chunk.choices:
+                            continue
+                        for field, value in parser.feed(chunk.choices[0].delta.content or ""):
+                            if field in TEXT_FIELDS and field not in sent:
+                                sent.add(field)
+                                yield field, value
+            except Exception as e:
+                _record_call(model, started, classify(e))
+                raise
+            _record_call(model, started, "success")
+            health.record_success(probe)
+            if parser.done:
+                parse_stats["parsed"] += 1
+                data = parser.fields
+            else:
+                # Cut off or not a clean object: recover what we can from the whole answer
+                try:
+                    with timed("parse"):
+                        data = {**_parse_content(parser.buffer), **parser.fields}
+                except ValueError:
+                    if not sent:
+                        raise
+                    data = parser.fields
+            model_latency.record(model, time.monotonic() - started)
+            router.record(model, error_msg, True, time.monotonic() - started)
+            with timed("links"):
+                links = await clean_links_async(data.get("relevant_links", []),
+                                                fallback=doc_links(data.get("error_type"), error_msg))
+            result = _result(data, links)
         except Exception as e:
-            if i < retries - 1:
-                time.sleep(2 ** i)
+            if not sent and _structured_unsupported(args, e):
                 continue
-            return {
-                "error_type": "InternalError",
-                "explanation": "Internal error occurred.",
-                "suggested_fix": str(e),
-                "relevant_links": []
-            }
+            router.record(model, error_msg, False)
+            kind = classify(e)
+            if kind == RETRYABLE:
+                health.record_failure(probe)
+            attempt += 1
+            # Only retry if nothing has reached the client yet
+            if not sent and attempt < max_attempts(kind, retries):
+                metrics.retries.inc(model=model, kind=kind)
+                with timed("backoff"):
+                    await asyncio.sleep(backoff_delay(attempt - 1, e))
+                continue
+            result = failure_result(e)
+        finally:
+            health.release(probe)
+
+    for field in TEXT_FIELDS:
+        if field not in sent:
+            yield field, result[field]
+    yield "relevant_links", result["relevant_links"]
+    if use_cache and _cacheable(result):
+        await remember_async(error_msg, key, model_to_use, result)
+    yield "done", result
+
+
+def _transport():
+    """The transport module if anything has used it yet (importing it just to close it would be wasted work)."""
+    return sys.modules.get(f"{__package__}.transport")
+
+
+def close() -> None:
+    """Close pooled blocking HTTP connections."""
+    if _transport() is not None:
+        _transport().close()
+
+
+async def aclose() -> None:
+    """Close pooled HTTP connections. Call on application shutdown."""
+    if _transport() is not None:
+        await _transport().aclose()
+        _transport().close()
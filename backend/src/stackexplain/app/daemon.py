@@ -0,0 +1,121 @@
+import os, json, socket, signal
+
+# Same default directory as the caches (see cache.py, not imported here to keep the client light)
+CACHE_DIR = os.path.expanduser(os.getenv("STACKEXPLAIN_CACHE_DIR", "~/.cache/stackexplain"))
+
+# Where the resident daemon listens; the CLI uses it whenever something is listening here
+SOCKET_PATH = os.path.expanduser(os.getenv("STACKEXPLAIN_SOCKET", os.path.join(CACHE_DIR, "daemon.sock")))
+CONNECT_TIMEOUT = 0.5
+# How long the CLI waits for the daemon to answer (the daemon itself may be waiting on a model)
+READ_TIMEOUT = 300.0
+
+
+class DaemonError(Exception):
+    """The daemon reported an error or hung up mid-answer."""
+
+
+# Client side: kept to the standard library so talking to the daemon stays cheap
+
+def connect(path: str = SOCKET_PATH) -> socket.socket | None:
+    """A connection to a running daemon, or None if there isn't one."""
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    sock.settimeout(READ_TIMEOUT)
+    return sock
+
+
+def events(sock: socket.socket, request: dict):
+    """Send one request and yield the (event, data) pairs the daemon answers with, ending with "done"."""
+    with sock, sock.makefile("rb") as replies:
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        for line in replies:
+            message = json.loads(line)
+            if message["event"] == "error":
+                raise DaemonError(message["data"])
+            yield message["event"], message["data"]
+            if message["event"] == "done":
+                return
+    raise DaemonError("The daemon closed the connection before answering")
+
+
+# Server side (asyncio is imported here rather than at the top, again to keep the client light)
+
+async def _answer(request: dict):
+    from .core import explain_error_stream
+    from .models import resolve_model, DEFAULT_MODEL
+    from .hedge import explain_error_auto, AUTO
+    error = request["error"]
+    model = resolve_model(request.get("model") or DEFAULT_MODEL)
+    force_llm = bool(request.get("force_llm"))
+    if request.get("stream") and model != AUTO:
+        async for event, data in explain_error_stream(error, model_to_use=model, force_llm=force_llm):
+            yield event, data
+    else:
+        yield "done", await explain_error_auto(error, model_to_use=model, force_llm=force_llm)
+
+
+async def _handle(reader, writer) -> None:
+    import asyncio
+    try:
+        request = json.loads(await reader.readline())
+        async for event, data in _answer(request):
+            writer.write(json.dumps({"event": event, "data": data}).encode() + b"\n")
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    except Exception as e:
+        writer.write(json.dumps({"event": "error", "data": f"{type(e).__name__}: {e}"}).encode() + b"\n")
+    finally:
+        writer.close()
+
+
+def _warm_up() -> None:
+    """Load everything a request needs up front so the first one is as fast as the rest."""
+    from . import core, hedge  # hedge serves --model auto
+    if core.api_key:
+        core.get_async_client()
+    else:
+        # The client can't be built without a key, but the SDK can still be loaded;
+        # requests that need a model then report the missing key
+        import openai
+    core.signature_index._compile()
+
+
+async def serve(path: str = SOCKET_PATH) -> None:
+    """Answer CLI requests on a Unix socket until cancelled."""
+    import asyncio
+    from . import core
+    probe = connect(path)
+    if probe is not None:
+        probe.close()
+        raise RuntimeError(f"A daemon is already listening on {path}")
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    if os.path.exists(path):
+        os.unlink(path)  # left behind by a daemon that didn't shut down cleanly
+    _warm_up()
+    # Only the current user may connect
+    old_umask = os.umask(0o177)
+    try:
+        server = await asyncio.start_unix_server(_handle, path)
+    finally:
+        os.umask(old_umask)
+    # Stop cleanly (removing the socket) on SIGTERM as well as Ctrl+C
+    stopped = asyncio.get_running_loop().create_future()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopped.set_result, None)
+    except NotImplementedError:
+        pass
+    try:
+        async with server:
+            await stopped
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+        await core.aclose()
@@ -0,0 +1,126 @@
+import os, time, uuid, asyncio, contextvars
+from collections import OrderedDict
+from . import core
+from .core import inflight, clean_links_async, doc_links
+from .fingerprint import fingerprint
+from .hedge import AUTO, race_models
+from .router import router, KNOWN_ROUTING
+from .links import candidate_links
+from .metrics import timed
+
+# Answer /explain before links are verified, by default (clients can also ask per request)
+DEFER_LINKS = os.getenv("STACKEXPLAIN_DEFER_LINKS", "0") == "1"
+# Background tasks verifying deferred links
+LINK_WORKERS = int(os.getenv("STACKEXPLAIN_LINK_WORKERS", "4"))
+# Link jobs kept for clients to collect, and for how long (seconds)
+LINK_JOBS_MAX = int(os.getenv("STACKEXPLAIN_LINK_JOBS_MAX", "10000"))
+LINK_JOB_TTL = float(os.getenv("STACKEXPLAIN_LINK_JOB_TTL", "600"))
+
+
+class LinkJobs:
+    """Verifies links for answers already sent, keeping each outcome for `ttl` seconds.
+
+    Jobs are "pending" until a worker has checked their links, then "done". If the
+    queue is full a job is "unverified" straight away and keeps the model's links as they were.
+    """
+
+    def __init__(self, workers: int = LINK_WORKERS, max_jobs: int = LINK_JOBS_MAX, ttl: float = LINK_JOB_TTL):
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._jobs: OrderedDict[str, dict] = OrderedDict()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    def _start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop, self._queue = loop, asyncio.Queue(self.max_jobs)
+        # Workers start in an empty context so their timings aren't added to the request that started them
+        self._tasks = [contextvars.Context().run(loop.create_task, self._work()) for _ in range(self.workers)]
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        while self._jobs:
+            job_id, job = next(iter(self._jobs.items()))
+            if job["expires"] > now and len(self._jobs) <= self.max_jobs:
+                break
+            del self._jobs[job_id]
+
+    def submit(self, error_msg: str, result: dict, key: str, model: str) -> str:
+        """Queue `result`'s links for checking; the checked result is then cached (see core.remember). Returns the job id."""
+        self._start()
+        job_id = uuid.uuid4().hex
+        job = {"status": "pending", "relevant_links": None, "expires": time.monotonic() + self.ttl}
+        self._jobs[job_id] = job
+        self._expire()
+        try:
+            self._queue.put_nowait((job_id, error_msg, result, key, model))
+        except asyncio.QueueFull:
+            job.update(status="unverified", relevant_links=result["relevant_links"])
+        return job_id
+
+    def get(self, job_id: str) -> dict | None:
+        """The job's status and, once done, its links; None if unknown or expired."""
+        self._expire()
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        return {"status": job["status"], "relevant_links": job["relevant_links"]}
+
+    async def _work(self) -> None:
+        while True:
+            job_id, error_msg, result, key, model = await self._queue.get()
+            try:
+                with timed("links"):
+                    links = await clean_links_async(result["relevant_links"],
+                                                    fallback=doc_links(result["error_type"], error_msg))
+            except Exception:
+                links = []
+            await core.remember_async(error_msg, key, model, {**result, "relevant_links": links})
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(status="done", relevant_links=links, expires=time.monotonic() + self.ttl)
+
+    async def aclose(self) -> None:
+        """Stop the workers; links still queued are not checked."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks, self._loop, self._queue = [], None, None
+
+
+jobs = LinkJobs()
+
+
+async def explain_error_deferred(error_msg: str, model_to_use: str = AUTO, retries: int = 3,
+                                 force_llm: bool = False, lookup: bool = True) -> dict:
+    """Like explain_error_auto, but returns as soon as the model answers.
+
+    The links in a fresh answer are unverified. The result then has "links_pending": True
+    and a "links_job" id to look up the verified links with (see LinkJobs.get).
+    Known and cached answers come back complete, as usual (unless lookup=False says
+    they have already been looked for).
+    """
+    decision = router.choose(error_msg) if model_to_use == AUTO else None
+    models = decision["order"] if decision else [model_to_use]
+    known = core.cached_answer(error_msg, models, force_llm=force_llm) if lookup else None
+    if known is not None:
+        return {**known, "routing": KNOWN_ROUTING} if decision else known
+    key = fingerprint(error_msg)
+
+    async def compute() -> dict:
+        try:
+            if model_to_use == AUTO:
+                data, model = await race_models(error_msg, models, retries)
+            else:
+                data, model = await core._fetch_with_failover_async(error_msg, model_to_use, retries), model_to_use
+        except Exception as e:
+            return core.failure_result(e)
+        result = core._result(data, candidate_links(data.get("relevant_links", [])))
+        return {**result, "links_pending": True, "links_job": jobs.submit(error_msg, result, key, model)}
+
+    result = await inflight.do((key, model_to_use, "deferred"), compute)
+    return {**result, "routing": decision} if decision else result
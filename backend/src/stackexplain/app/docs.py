@@ -0,0 +1,112 @@
+import os, re, json
+from .signatures import DATA_DIR
+
+# Bundled index of documentation pages (rebuild with scripts/build_docs_index.py); empty turns it off
+DOCS_INDEX = os.getenv("STACKEXPLAIN_DOCS_INDEX", os.path.join(DATA_DIR, "docs_index.json"))
+
+# Hints for which runtime produced an error, checked in order
+_LANGUAGE_HINTS = [
+    ("java", re.compile(r"\bat [\w$.]+\([\w$]+\.(?:java|kt|scala):\d+\)|Exception in thread \"|\b(?:java|javax|jakarta)\.\w")),
+    ("node", re.compile(r"\bnode:internal\b|\bERR_[A-Z0-9_]+\b|\bE[A-Z]{3,}: ")),
+    ("javascript", re.compile(r"\bat .*\.(?:m?js|cjs|tsx?|jsx):\d+|Uncaught |\bnode_modules/")),
+    ("python", re.compile(r"Traceback \(most recent call last\)|File \"[^\"]+\", line \d+")),
+]
+# Otherwise the most likely first (this is mostly used for Python)
+_DEFAULT_ORDER = ["python", "javascript", "node", "java"]
+_CODE = re.compile(r"\b(ERR_[A-Z0-9_]+|E[A-Z]{3,}[A-Z0-9]*)\b")
+_NAME = re.compile(r"[\w$.]+")
+
+
+def guess_language(error_text: str) -> str | None:
+    """The runtime an error most likely came from, judging by its trace; None if nothing gives it away."""
+    for language, hint in _LANGUAGE_HINTS:
+        if hint.search(error_text):
+            return language
+    return None
+
+
+def _page(url: str) -> str:
+    return url.split("#")[0].rstrip("/")
+
+
+class DocsIndex:
+    """Canonical documentation pages for errors, by language and error type.
+
+    Links to pages in the index are trusted without being fetched, and `links_for`
+    supplies links for an error when the model's own don't check out.
+    """
+
+    def __init__(self, data: dict):
+        self.version = data.get("version")
+        self.built = data.get("built")
+        self.errors: dict[str, dict[str, list[str]]] = {}
+        self.messages: dict[str, list[tuple[re.Pattern, str]]] = {}
+        self._short: dict[str, dict[str, list[str]]] = {}
+        self._pages: set[str] = set()
+        for language, entry in data.get("languages", {}).items():
+            errors = entry.get("errors", {})
+            self.errors[language] = errors
+            # Java answers often give just the class name
+            short = self._short.setdefault(language, {})
+            for name, urls in errors.items():
+                if "." in name:
+                    short.setdefault(name.rsplit(".", 1)[1], urls)
+            self.messages[language] = [(re.compile(p), url) for p, url in entry.get("messages", [])]
+            urls = [u for us in errors.values() for u in us] + [u for _, u in entry.get("messages", [])]
+            self._pages.update(_page(u) for u in urls + entry.get("pages", []))
+
+    @classmethod
+    def load(cls, path: str) -> "DocsIndex":
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def __len__(self) -> int:
+        return sum(len(errors) for errors in self.errors.values())
+
+    def known(self, url: str) -> bool:
+        """True if the link points at (any anchor on) an indexed documentation page."""
+        return _page(url.replace("http://", "https://", 1)) in self._pages
+
+    def _languages(self, error_text: str) -> list[str]:
+        hinted = [language for language, hint in _LANGUAGE_HINTS if hint.search(error_text)]
+        others = [l for l in _DEFAULT_ORDER if l in self.errors] + [l for l in self.errors if l not in _DEFAULT_ORDER]
+        return hinted + [language for language in others if language not in hinted]
+
+    def links_for(self, error_type: str | None, error_text: str = "") -> list[str]:
+        """Documentation links for an error, most specific first; empty if the index doesn't know it."""
+        for language in self._languages(error_text):
+            errors = self.errors.get(language, {})
+            links: list[str] = []
+            # Node reports a code that says more than the error class
+            if language == "node":
+                for code in _CODE.findall(error_text):
+                    links += errors.get(code, [])
+            for pattern, url in self.messages.get(language, []):
+                if pattern.search(error_text):
+                    links.append(url)
+                    break
+            for name in _NAME.findall(error_type or ""):
+                links += errors.get(name) or self._short.get(language, {}).get(name, [])
+            if links:
+                return list(dict.fromkeys(links))
+        return []
+
+
+_index: DocsIndex | None = None
+
+
+def docs_index() -> DocsIndex | None:
+    """The bundled index, loaded on first use; None if it is turned off, empty if it can't be read."""
+    global _index
+    if _index is None and DOCS_INDEX:
+        try:
+            _index = DocsIndex.load(DOCS_INDEX)
+        except (OSError, ValueError):
+            # Remembered as empty, so a missing file isn't retried on every lookup
+            _index = DocsIndex({})
+    return _index
+
+
+def doc_links(error_type: str | None, error_text: str = "") -> list[str]:
+    index = docs_index()
+    return index.links_for(error_type, error_text) if index is not None else []
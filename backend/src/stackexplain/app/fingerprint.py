@@ -0,0 +1,37 @@
+import re, hashlib
+
+# Substitutions applied in order to strip the parts of an error message that vary between
+# occurrences of the same error (paths, line numbers, addresses, ids, literal values)
+_RULES = [
+    # Timestamps like 2024-05-01 12:30:01,123 or 2024-05-01T12:30:01Z
+    (re.compile(r"\b\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?"), "<ts>"),
+    (re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"), "<uuid>"),
+    (re.compile(r"\b0x[0-9a-fA-F]+\b"), "0x<addr>"),
+    # Directory part of file paths, keeping only the file name
+    (re.compile(r"(?:[A-Za-z]:)?(?:[\\/][^\s\\/\"'():]+)+[\\/](?=[^\s\\/\"'():]+)"), ""),
+    (re.compile(r"\bfile://"), ""),
+    (re.compile(r"\b(line|Line|ln)\s+\d+"), r"\1 N"),
+    # JS/Java style file.js:12:5 and File.java:42
+    (re.compile(r":\d+(?::\d+)?\b"), ":N"),
+    (re.compile(r"\b(pid|PID|thread|Thread|port)[\s=:#-]*\d+"), r"\1 N"),
+    # Quoted literals, except short identifier-like names (module, key and attribute names
+    # change what the error means, so they stay part of the fingerprint)
+    (re.compile(r"'(?![A-Za-z_][\w.]{0,39}')[^'\n]*'"), "'<v>'"),
+    (re.compile(r'"(?![A-Za-z_][\w.]{0,39}")[^"\n]*"'), '"<v>"'),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "N"),
+    (re.compile(r"[ \t]+"), " "),
+]
+
+
+def normalize_error(error: str) -> str:
+    """Reduce an error message to the parts that identify the error itself."""
+    text = error.strip()
+    for pattern, repl in _RULES:
+        text = pattern.sub(repl, text)
+    lines = [line.strip() for line in text.splitlines()]
+    return "\n".join(line for line in lines if line)
+
+
+def fingerprint(error: str) -> str:
+    """Stable identifier for an error, equal across occurrences that differ only in incidental details."""
+    return hashlib.sha256(normalize_error(error).encode("utf-8")).hexdigest()[:32]
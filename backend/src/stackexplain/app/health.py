@@ -0,0 +1,149 @@
+import os, json, time, random, threading
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("STACKEXPLAIN_BREAKER_FAILURES", "5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("STACKEXPLAIN_BREAKER_OPEN_SECONDS", "30"))
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# Failure classes
+RETRYABLE = "retryable"  # transient upstream trouble: 5xx, 429, timeouts, dropped connections
+MALFORMED = "malformed"  # the model answered but not with usable JSON; worth one more try
+FATAL = "fatal"          # the same request will fail again (bad request, auth, unknown model, open breaker)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a model whose circuit breaker is open."""
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"{model} is unavailable (circuit open, retry in {retry_after:.0f}s)")
+        self.model = model
+        self.retry_after = retry_after
+
+
+def classify(e: Exception) -> str:
+    import openai
+    if isinstance(e, CircuitOpenError):
+        return FATAL
+    if isinstance(e, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError,
+                      openai.InternalServerError)):
+        return RETRYABLE
+    if isinstance(e, openai.APIStatusError):
+        return RETRYABLE if e.status_code >= 500 or e.status_code in (408, 409, 429) else FATAL
+    if isinstance(e, (json.JSONDecodeError, ValueError, KeyError, TypeError, AttributeError, IndexError)):
+        return MALFORMED
+    return RETRYABLE
+
+
+def max_attempts(kind: str, retries: int) -> int:
+    """How many attempts in total a failure of this kind is worth."""
+    if kind == FATAL:
+        return 1
+    if kind == MALFORMED:
+        return min(retries, 2)
+    return retries
+
+
+def backoff_delay(attempt: int, e: Exception | None = None) -> float:
+    """Seconds to wait before retry number `attempt` (0-based): full-jitter exponential backoff.
+
+    A Retry-After header from the provider is honoured when present.
+    """
+    response = getattr(e, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        try:
+            if retry_after is not None:
+                return min(BACKOFF_CAP, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Tracks one model's health.
+
+    Closed: calls go through. After `threshold` consecutive upstream failures the breaker
+    opens and calls fail fast for `open_seconds`. It then goes half-open and lets a single
+    probe through; success closes it, failure opens it again.
+
+    check() says whether the call it admits is that probe, and the caller passes this on
+    to record_success, record_failure and release. Only the probe decides the half-open
+    outcome: a call admitted while the breaker was closed that finishes after it opened
+    changes nothing.
+    """
+
+    def __init__(self, model: str, threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 open_seconds: float = BREAKER_OPEN_SECONDS):
+        self.model = model
+        self.threshold = threshold
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def check(self) -> bool:
+        """Raise CircuitOpenError if a call to this model shouldn't be made right now.
+
+        Returns True if the call is the half-open probe.
+        """
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self.opened_at + self.open_seconds - time.monotonic()
+                if remaining > 0:
+                    raise CircuitOpenError(self.model, remaining)
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    raise CircuitOpenError(self.model, 1.0)
+                self._probing = True
+                return True
+            return False
+
+    def available(self) -> bool:
+        """Whether check() would currently let a call through (without claiming the probe)."""
+        with self._lock:
+            if self.state == OPEN:
+                return time.monotonic() >= self.opened_at + self.open_seconds
+            return not (self.state == HALF_OPEN and self._probing)
+
+    def record_success(self, probe: bool = False) -> None:
+        with self._lock:
+            if probe or self.state == CLOSED:
+                self.state = CLOSED
+                self.failures = 0
+                self._probing = False
+
+    def record_failure(self, probe: bool = False) -> None:
+        with self._lock:
+            if probe:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self._probing = False
+            elif self.state == CLOSED:
+                self.failures += 1
+                if self.failures >= self.threshold:
+                    self.state = OPEN
+                    self.opened_at = time.monotonic()
+
+    def release(self, probe: bool = False) -> None:
+        """Give up a half-open probe without a verdict (e.g. the call was cancelled or malformed)."""
+        with self._lock:
+            if probe:
+                self._probing = False
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def breaker(model: str) -> CircuitBreaker:
+    if model not in _breakers:
+        _breakers[model] = CircuitBreaker(model)
+    return _breakers[model]
+
+
+def breaker_states() -> dict[str, str]:
+    return {model: b.state for model, b in _breakers.items()}
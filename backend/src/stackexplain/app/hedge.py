@@ -0,0 +1,156 @@
+import os, asyncio, threading
+from . import core
+from .core import inflight, clean_links_async, doc_links
+from .fingerprint import fingerprint
+from .metrics import timed
+from .router import router, ROUTER_MODELS, KNOWN_ROUTING
+
+AUTO = "auto"
+# Models --model auto chooses between; the router decides their order for each error
+AUTO_MODELS = ROUTER_MODELS
+# Send a hedge once the primary has taken longer than this percentile of its recent latencies
+HEDGE_PERCENTILE = float(os.getenv("STACKEXPLAIN_HEDGE_PERCENTILE", "90"))
+# Delay used until a model has enough samples, and bounds on the computed delay (seconds)
+HEDGE_DEFAULT_DELAY = float(os.getenv("STACKEXPLAIN_HEDGE_DEFAULT_DELAY", "8"))
+HEDGE_MIN_DELAY = 1.0
+HEDGE_MAX_DELAY = 30.0
+HEDGE_MIN_SAMPLES = 10
+# Hedges allowed per primary request; 1.0 would allow doubling upstream load, so it is capped there
+HEDGE_BUDGET_RATIO = min(1.0, float(os.getenv("STACKEXPLAIN_HEDGE_BUDGET", "0.2")))
+
+
+class HedgeBudget:
+    """Each primary request earns `ratio` hedge credits (up to `burst`); each hedge spends one."""
+
+    def __init__(self, ratio: float = HEDGE_BUDGET_RATIO, burst: float = 10.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.credits = 0.0
+        self._lock = threading.Lock()
+
+    def on_request(self) -> None:
+        with self._lock:
+            self.credits = min(self.burst, self.credits + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.credits >= 1.0:
+                self.credits -= 1.0
+                return True
+            return False
+
+
+hedge_budget = HedgeBudget()
+hedge_stats = {"requests": 0, "hedges": 0, "hedge_wins": 0, "failovers": 0}
+
+
+def hedge_delay(model: str) -> float:
+    """How long to wait for `model` before hedging, from its recent latency distribution."""
+    if core.model_latency.count(model) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY
+    delay = core.model_latency.percentile(model, HEDGE_PERCENTILE)
+    return min(HEDGE_MAX_DELAY, max(HEDGE_MIN_DELAY, delay))
+
+
+async def race_models(error_msg: str, models: list[str], retries: int = 3, limit=None) -> tuple[dict, str]:
+    """Get a parsed answer from models[0], hedging to the next model if it is slow or fails.
+
+    The first valid answer wins and the other request is cancelled. Slow-primary hedges
+    are limited by the hedge budget; if a model fails outright the next one is always tried.
+    `limit(model)`, if given, is awaited before each model is called (batches pass their
+    per-model rate limiters). Returns (data, model that answered); raises the last error
+    if every attempt fails.
+    """
+    async def call(model: str) -> dict:
+        if limit is not None:
+            await limit(model)
+        return await core._fetch_data_async(error_msg, model, retries)
+
+    hedge_budget.on_request()
+    hedge_stats["requests"] += 1
+    loop = asyncio.get_running_loop()
+    queue = list(models)
+    primary = queue.pop(0)
+    tasks = {asyncio.create_task(call(primary)): primary}
+    hedge_at = loop.time() + hedge_delay(primary)
+    pending = set(tasks)
+    last_error: Exception | None = None
+    try:
+        while pending or queue:
+            timeout = max(0.0, hedge_at - loop.time()) if queue and hedge_at is not None else None
+            if pending:
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            else:
+                done = set()
+            for task in done:
+                if task.exception() is None:
+                    if tasks[task] != primary:
+                        hedge_stats["hedge_wins"] += 1
+                    return task.result(), tasks[task]
+                last_error = task.exception()
+            if not queue:
+                continue
+            failed = bool(done) and not pending
+            timed_out = not done and hedge_at is not None
+            if failed or (timed_out and hedge_budget.try_spend()):
+                hedge_stats["failovers" if failed else "hedges"] += 1
+                model = queue.pop(0)
+                task = asyncio.create_task(call(model))
+                tasks[task] = model
+                pending.add(task)
+                hedge_at = loop.time() + hedge_delay(model)
+            elif timed_out:
+                # Out of hedge budget: keep waiting on what's already running
+                hedge_at = None
+        raise last_error or RuntimeError("No model answered")
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def explain_error_hedged(error_msg: str, models: list[str] | None = None, retries: int = 3,
+                               use_cache: bool = True, force_llm: bool = False, lookup: bool = True,
+                               limit=None) -> dict:
+    """Like explain_error_async, but races models to cut tail latency (see race_models).
+
+    Without `models`, the router picks the order to try them in.
+    """
+    models = models or router.choose(error_msg)["order"]
+    known = core.cached_answer(error_msg, models, use_cache, force_llm) if lookup else None
+    if known is not None:
+        return known
+    key = fingerprint(error_msg)
+
+    async def compute() -> dict:
+        try:
+            data, model = await race_models(error_msg, models, retries, limit)
+        except Exception as e:
+            return core.failure_result(e)
+        with timed("links"):
+            links = await clean_links_async(data.get("relevant_links", []),
+                                            fallback=doc_links(data.get("error_type"), error_msg))
+        result = core._result(data, links)
+        if use_cache:
+            await core.remember_async(error_msg, key, model, result)
+        return result
+
+    if not use_cache:
+        return await compute()
+    return await inflight.do((key, AUTO), compute)
+
+
+async def explain_error_auto(error_msg: str, model_to_use: str = AUTO, **kwargs) -> dict:
+    """explain_error_async for a single model, or explain_error_hedged when model_to_use is "auto".
+
+    "auto" results carry the router's decision under "routing" (KNOWN_ROUTING if no model was needed).
+    """
+    if model_to_use == AUTO:
+        decision = router.choose(error_msg)
+        if kwargs.pop("lookup", True):
+            known = core.cached_answer(error_msg, decision["order"], kwargs.get("use_cache", True),
+                                       kwargs.get("force_llm", False))
+            if known is not None:
+                return {**known, "routing": KNOWN_ROUTING}
+        result = await explain_error_hedged(error_msg, models=decision["order"], lookup=False, **kwargs)
+        return {**result, "routing": decision}
+    return await core.explain_error_async(error_msg, model_to_use=model_to_use, **kwargs)
@@ -0,0 +1,31 @@
+import threading
+from collections import deque
+
+LATENCY_WINDOW = 200
+
+
+class LatencyTracker:
+    """Keeps the most recent successful call latencies (seconds) for each model."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._samples: dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, seconds: float) -> None:
+        with self._lock:
+            if model not in self._samples:
+                self._samples[model] = deque(maxlen=self.window)
+            self._samples[model].append(seconds)
+
+    def count(self, model: str) -> int:
+        return len(self._samples.get(model, ()))
+
+    def percentile(self, model: str, q: float, default: float | None = None) -> float | None:
+        """The q-th percentile (0-100) of recent latencies, or default if there are no samples."""
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if not samples:
+            return default
+        index = min(len(samples) - 1, int(round(q / 100 * (len(samples) - 1))))
+        return samples[index]
@@ -0,0 +1,193 @@
+import os, re, time, asyncio
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from .cache import LinkCache
+from .metrics import link_checks
+from .docs import docs_index
+
+# How many links to check at once, and the wall-clock budget (seconds) for the whole link step
+LINK_CHECK_CONCURRENCY = int(os.getenv("STACKEXPLAIN_LINK_CONCURRENCY", "4"))
+LINK_CHECK_BUDGET = float(os.getenv("STACKEXPLAIN_LINK_BUDGET", "6"))
+LINK_TIMEOUT = 5
+MAX_LINKS = 3
+# Only this much of each page is downloaded while looking for its <title>
+SNIFF_BYTES = 16 * 1024
+
+_TITLE_END = re.compile(rb"</title\s*>", re.IGNORECASE)
+
+# Verdicts for previously checked URLs, persisted on disk
+link_cache = LinkCache()
+
+
+def _title_ok(html: str, max_title_len: int = 100) -> bool:
+    """Check that an HTML document has a non-empty, reasonably short title."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    title = soup.title.string if soup.title else ""
+    # Check title exists and isn't nonsense or empty
+    return bool(title) and len(title) <= max_title_len
+
+
+def _head_complete(head: bytes) -> bool:
+    """True once the closing </title> tag is seen or SNIFF_BYTES have been read."""
+    return len(head) >= SNIFF_BYTES or _TITLE_END.search(head) is not None
+
+
+def _decode_head(head: bytes, encoding: str | None) -> str:
+    return head[:SNIFF_BYTES].decode(encoding or "utf-8", errors="replace")
+
+
+def verify_link(url: str, max_title_len: int = 100, use_cache: bool = True) -> bool:
+    """Check if a link is reachable and has a reasonable HTML title."""
+    if use_cache:
+        cached = link_cache.get(url)
+        if cached is not None:
+            link_checks.inc(result="cache_hit")
+            return cached
+    from . import transport
+    try:
+        with transport.sync_client().stream("GET", url, timeout=transport.timeout(LINK_TIMEOUT),
+                                            follow_redirects=True) as resp:
+            resp.raise_for_status()
+            head = b""
+            for chunk in resp.iter_bytes():
+                head += chunk
+                if _head_complete(head):
+                    break
+        ok = _title_ok(_decode_head(head, resp.encoding), max_title_len)
+    except Exception as e:
+        # print(e)
+        ok = False
+    link_checks.inc(result="ok" if ok else "rejected")
+    if use_cache:
+        link_cache.set(url, ok)
+    return ok
+
+
+async def verify_link_async(url: str, max_title_len: int = 100, use_cache: bool = True) -> bool:
+    """Async version of verify_link that doesn't block the event loop."""
+    if use_cache:
+        cached = link_cache.get(url)
+        if cached is not None:
+            link_checks.inc(result="cache_hit")
+            return cached
+    from . import transport
+    try:
+        async with transport.async_client().stream("GET", url, timeout=transport.timeout(LINK_TIMEOUT),
+                                                   follow_redirects=True) as resp:
+            resp.raise_for_status()
+            head = b""
+            async for chunk in resp.aiter_bytes():
+                head += chunk
+                if _head_complete(head):
+                    break
+        ok = _title_ok(_decode_head(head, resp.encoding), max_title_len)
+    except Exception as e:
+        # print(e)
+        ok = False
+    link_checks.inc(result="ok" if ok else "rejected")
+    if use_cache:
+        await asyncio.to_thread(link_cache.set, url, ok)
+    return ok
+
+
+def _split_cached(candidates: list[str]) -> tuple[list[int], list[int]]:
+    """Split candidate indices into (indexed or cached as good, not yet known); cached-bad links are dropped."""
+    passed, unknown = [], []
+    index = docs_index()
+    for i, link in enumerate(candidates):
+        if index is not None and index.known(link):
+            link_checks.inc(result="indexed")
+            passed.append(i)
+            continue
+        cached = link_cache.get(link)
+        if cached is None:
+            unknown.append(i)
+            continue
+        link_checks.inc(result="cache_hit")
+        if cached:
+            passed.append(i)
+    return passed, unknown
+
+
+def candidate_links(links: list[str], max_len: int = 200) -> list[str]:
+    """Drop links that are obviously unusable before doing any network checks."""
+    candidates = []
+    for link in links:
+        if not isinstance(link, str):
+            continue
+        if len(link) > max_len:
+            continue  # too long
+        if any(bad in link for bad in ["duckduckgo.com", "google.com/search"]):
+            continue
+        if link in candidates:
+            continue
+        candidates.append(link)
+    return candidates
+
+
+def _with_fallback(links: list[str], fallback: list[str]) -> list[str]:
+    """Top up verified links with documentation links from the index, up to MAX_LINKS."""
+    return list(dict.fromkeys(links + list(fallback)))[:MAX_LINKS]
+
+
+def clean_links(links: list[str], max_len: int = 200, budget: float = LINK_CHECK_BUDGET,
+                fallback: list[str] = ()) -> list[str]:
+    """Verify candidate links concurrently, stopping once MAX_LINKS pass or the budget runs out.
+
+    Links keep the order the model suggested them in. Links to pages in the docs index pass
+    without a fetch. `fallback` (the index's links for this error) fills whatever slots
+    are left once the model's links have been checked.
+    """
+    candidates = candidate_links(links, max_len)
+    passed, unknown = _split_cached(candidates)
+    if len(passed) >= MAX_LINKS or not unknown:
+        return _with_fallback([candidates[i] for i in passed], fallback)
+    deadline = time.monotonic() + budget
+    pool = ThreadPoolExecutor(max_workers=min(LINK_CHECK_CONCURRENCY, len(unknown)))
+    try:
+        pending = {pool.submit(verify_link, candidates[i]): i for i in unknown}
+        while pending and len(passed) < MAX_LINKS:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = pending.pop(future)
+                if future.result():
+                    passed.append(i)
+    finally:
+        # Don't wait for checks we no longer need
+        pool.shutdown(wait=False, cancel_futures=True)
+    return _with_fallback([candidates[i] for i in sorted(passed)], fallback)
+
+
+async def clean_links_async(links: list[str], max_len: int = 200, budget: float = LINK_CHECK_BUDGET,
+                            fallback: list[str] = ()) -> list[str]:
+    """Async version of clean_links; unfinished checks are cancelled on early exit."""
+    candidates = candidate_links(links, max_len)
+    passed, unknown = _split_cached(candidates)
+    if len(passed) >= MAX_LINKS or not unknown:
+        return _with_fallback([candidates[i] for i in passed], fallback)
+    sem = asyncio.Semaphore(LINK_CHECK_CONCURRENCY)
+
+    async def check(link: str) -> bool:
+        async with sem:
+            return await verify_link_async(link)
+
+    deadline = time.monotonic() + budget
+    pending = {asyncio.create_task(check(candidates[i])): i for i in unknown}
+    try:
+        while pending and len(passed) < MAX_LINKS:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, _ = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                i = pending.pop(task)
+                if task.result():
+                    passed.append(i)
+    finally:
+        for task in pending:
+            task.cancel()
+    return _with_fallback([candidates[i] for i in sorted(passed)], fallback)
+
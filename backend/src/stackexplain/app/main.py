@@ -1,16 +1,182 @@
 # To run: uvicorn main:app --reload
 
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from .core import explain_error
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field
+import os, json, time
+from . import core, metrics, admission, deferred
+from .admission import Rejected, MAX_ERROR_CHARS, MAX_REQUEST_BYTES
+from .core import explain_error_stream, resolve_model, DEFAULT_MODEL
+from .batch import explain_batch, BATCH_CONCURRENCY
+from .hedge import explain_error_auto, AUTO, AUTO_MODELS, hedge_stats
+from .router import router, KNOWN_ROUTING
+from .deferred import explain_error_deferred, DEFER_LINKS
+from .streaming import sse_event
+from .health import breaker_states
+from .repair import parse_stats
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await deferred.jobs.aclose()
+    await core.aclose()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
 
+# Metrics read from state the app already keeps
+metrics.Gauge("stackexplain_explanations_in_flight", "Distinct explanations currently being computed",
+              function=lambda: core.inflight.in_flight())
+metrics.Counter("stackexplain_result_cache_lookups_total", "Result cache lookups", ("result",),
+                function=lambda: {("hit",): core.result_cache.hits, ("miss",): core.result_cache.misses})
+metrics.Counter("stackexplain_json_parses_total", "Model answers by how they parsed", ("result",),
+                function=lambda: {(k,): v for k, v in parse_stats.items()})
+metrics.Counter("stackexplain_hedge_events_total", "Hedged (--model auto) requests, hedges and failovers", ("event",),
+                function=lambda: {(k,): v for k, v in hedge_stats.items()})
+metrics.Gauge("stackexplain_circuit_open", "1 while a model's circuit breaker is open or half-open", ("model",),
+              function=lambda: {(m,): int(state != "closed") for m, state in breaker_states().items()})
+metrics.Gauge("stackexplain_admission_slots", "Model work slots in use, and requests queued for one", ("state",),
+              function=lambda: {("active",): admission.queue.active, ("queued",): admission.queue.waiting})
+
+@app.exception_handler(Rejected)
+async def rejected(request: Request, e: Rejected):
+    metrics.rejected_requests.inc(status=e.status)
+    return JSONResponse({"detail": e.detail}, status_code=e.status, headers=e.headers())
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    """Count in-flight requests and report each request's stage timings in a Server-Timing header."""
+    timings = metrics.start_request()
+    started = time.perf_counter()
+    metrics.requests_in_flight.inc()
+    try:
+        response = await call_next(request)
+    finally:
+        metrics.requests_in_flight.dec()
+    # Streaming responses send their headers before the work is done, so this covers what ran before that
+    response.headers["Server-Timing"] = metrics.server_timing(timings, time.perf_counter() - started)
+    return response
+
+@app.middleware("http")
+async def limit_body(request: Request, call_next):
+    """Refuse oversized bodies from their Content-Length, before reading them."""
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > MAX_REQUEST_BYTES:
+        metrics.rejected_requests.inc(status=413)
+        return JSONResponse({"detail": f"Request body over {MAX_REQUEST_BYTES} bytes"}, status_code=413)
+    return await call_next(request)
+
+def client_of(request: Request) -> str:
+    return admission.client_id(request.headers, request.client.host if request.client else None)
+
+MAX_BATCH_ITEMS = 1000
+# Model used when a request doesn't name one; "auto" lets the router choose per error
+API_DEFAULT_MODEL = os.getenv("STACKEXPLAIN_API_MODEL", AUTO)
+
 class ErrorRequest(BaseModel):
-    error: str
+    error: str = Field(max_length=MAX_ERROR_CHARS)
+    model: str | None = None
+    force_llm: bool = False
+    defer_links: bool = DEFER_LINKS
+
+class BatchItem(BaseModel):
+    id: str | None = None
+    error: str = Field(max_length=MAX_ERROR_CHARS)
+    model: str | None = None
+    force_llm: bool | None = None
+
+class BatchRequest(BaseModel):
+    errors: list[BatchItem]
+    model: str | None = None
+    force_llm: bool = False
+    concurrency: int = BATCH_CONCURRENCY
 
 @app.post("/explain")
-async def explain(req: ErrorRequest):
-    return explain_error(req.error)
+async def explain(req: ErrorRequest, request: Request):
+    admission.clients.check(client_of(request))
+    model = resolve_model(req.model or API_DEFAULT_MODEL)
+    # Known and cached answers don't need a model, so they skip the queue
+    known = core.cached_answer(req.error, AUTO_MODELS if model == AUTO else [model], force_llm=req.force_llm)
+    if known is not None:
+        return {**known, "routing": KNOWN_ROUTING} if model == AUTO else known
+    started = await admission.queue.acquire()
+    try:
+        if req.defer_links:
+            return await explain_error_deferred(req.error, model_to_use=model, force_llm=req.force_llm, lookup=False)
+        return await explain_error_auto(req.error, model_to_use=model, force_llm=req.force_llm, lookup=False)
+    finally:
+        admission.queue.release(started)
+
+@app.get("/explain/{job_id}/links")
+async def explain_links(job_id: str):
+    """Verified links for an answer sent with "links_pending"; "status" stays "pending" until they are ready."""
+    job = deferred.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired link job")
+    return job
+
+@app.post("/explain/stream")
+async def explain_stream(req: ErrorRequest, request: Request):
+    admission.clients.check(client_of(request))
+    model = resolve_model(req.model or API_DEFAULT_MODEL)
+    if model == AUTO:
+        # Streams can't be raced, so "auto" streams from the router's first choice
+        model = router.choose(req.error)["model"]
+    # Take a slot before answering, so a busy server can still say so with a 503
+    known = core.cached_answer(req.error, [model], force_llm=req.force_llm)
+    slot = await admission.queue.acquire() if known is None else None
+
+    def release():
+        nonlocal slot
+        if slot is not None:
+            admission.queue.release(slot)
+            slot = None
+
+    async def events():
+        try:
+            if known is not None:
+                for event, data in core.answer_events(known):
+                    yield sse_event(event, data)
+                return
+            async for event, data in explain_error_stream(req.error, model_to_use=model, force_llm=req.force_llm,
+                                                          lookup=False):
+                yield sse_event(event, data)
+        finally:
+            release()
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"},
+                             background=BackgroundTask(release))
+
+@app.post("/explain/batch")
+async def explain_batch_endpoint(req: BatchRequest, request: Request):
+    """Explain many errors; results are streamed back as JSON lines in completion order.
+
+    Batches are paced by their own concurrency and per-model rate limits rather than the admission queue.
+    """
+    admission.clients.check(client_of(request))
+    if len(req.errors) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_ITEMS} errors per batch")
+    default_model = resolve_model(req.model or DEFAULT_MODEL)
+    items = [
+        {"id": item.id or str(i), "error": item.error, "model": resolve_model(item.model or default_model),
+         "force_llm": req.force_llm if item.force_llm is None else item.force_llm}
+        for i, item in enumerate(req.errors, start=1)
+    ]
+    concurrency = max(1, min(req.concurrency, BATCH_CONCURRENCY))
+
+    async def lines():
+        async for record in explain_batch(items, concurrency=concurrency):
+            yield json.dumps(record) + "\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health")
+async def health():
+    """Circuit breaker state of each model that has been called, how many answers needed JSON repair,
+    and the router's latency and success estimates."""
+    return {"models": breaker_states(), "parse": parse_stats, "routing": router.stats()}
@@ -0,0 +1,161 @@
+import time, threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Default histogram buckets (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry: list["Metric"] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Metric:
+    """A named metric with optional labels, rendered in the Prometheus text format.
+
+    Pass `function` to report values computed at scrape time instead: it returns a number,
+    or a dict mapping label-value tuples to numbers.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), function=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels[n] for n in self.labelnames)
+
+    def samples(self):
+        if self.function is not None:
+            values = self.function()
+            values = values if isinstance(values, dict) else {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        for key, value in values.items():
+            yield self.name, key, value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for name, key, value in self.samples():
+            lines.append(f"{name}{_labels(self.labelnames, key)} {value}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        self._series: dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in series.items():
+            for bound, count in zip(self.buckets, values):
+                lines.append(f"{self.name}_bucket{_labels(names, key + (bound,))} {count}")
+            lines.append(f"{self.name}_bucket{_labels(names, key + ('+Inf',))} {values[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {values[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {values[-1]}")
+        return "\n".join(lines)
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+stage_seconds = Histogram("stackexplain_stage_seconds", "Time spent in each stage of explaining an error", ("stage",))
+model_requests = Counter("stackexplain_model_requests_total", "Model calls by outcome", ("model", "outcome"))
+model_latency = Histogram("stackexplain_model_latency_seconds", "Latency of successful model calls", ("model",))
+retries = Counter("stackexplain_retries_total", "Model call retries by failure class", ("model", "kind"))
+tokens = Counter("stackexplain_tokens_total", "Tokens reported by completions", ("type",))
+link_checks = Counter("stackexplain_link_checks_total", "Link verifications by how they were answered", ("result",))
+requests_in_flight = Gauge("stackexplain_requests_in_flight", "API requests currently being handled")
+rejected_requests = Counter("stackexplain_rejected_requests_total", "API requests turned away by admission control", ("status",))
+
+
+# Per-request stage breakdown, for Server-Timing headers and the CLI's --profile
+_timings: ContextVar[dict | None] = ContextVar("stackexplain_timings", default=None)
+
+
+def start_request() -> dict:
+    """Start collecting stage timings for the current request (and tasks it starts); returns the dict they go into."""
+    timings: dict[str, list[float]] = {}
+    _timings.set(timings)
+    return timings
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    stage_seconds.observe(seconds, stage=stage)
+    timings = _timings.get()
+    if timings is not None:
+        entry = timings.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+
+@contextmanager
+def timed(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def server_timing(timings: dict, total: float | None = None) -> str:
+    """Format stage timings as a Server-Timing header value."""
+    parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, (seconds, _) in timings.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
@@ -0,0 +1,24 @@
+# Short names accepted by the CLI and API, and the OpenRouter model each one stands for
+MODEL_MAP = {
+    "deepseek": "deepseek/deepseek-chat-v3-0324:free",
+    "gemini": "google/gemini-2.0-flash-exp:free",
+    "mistral": "mistralai/mistral-small-3.2-24b-instruct:free",
+}
+DEFAULT_MODEL = MODEL_MAP["deepseek"]
+
+# What the router (router.py) assumes about each model until it has measured it: typical
+# latency (seconds) and answer quality (0-1) for short errors and for long traces, and
+# whether few-shot examples help it (they do for DeepSeek and Gemini)
+MODEL_PROFILES = {
+    MODEL_MAP["deepseek"]: {"latency": {"short": 6.0, "long": 12.0}, "quality": {"short": 0.9, "long": 0.85},
+                            "few_shot": True},
+    MODEL_MAP["gemini"]: {"latency": {"short": 3.0, "long": 6.0}, "quality": {"short": 0.85, "long": 0.9},
+                          "few_shot": True},
+    MODEL_MAP["mistral"]: {"latency": {"short": 4.0, "long": 9.0}, "quality": {"short": 0.8, "long": 0.65},
+                           "few_shot": False},
+}
+
+
+def resolve_model(name: str) -> str:
+    """Map a short model name (e.g. "gemini") to its full id; full ids pass through unchanged."""
+    return MODEL_MAP.get(name, name)
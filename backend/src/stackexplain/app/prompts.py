@@ -0,0 +1,143 @@
+import json
+from .compact import compact_error, error_token_budget
+from .models import MODEL_PROFILES
+
+# "mistralai/mistral-small-3.2-24b-instruct:free"
+
+EXAMPLES = [
+    {
+        "language": "Python",
+        "input": "IndexError: list index out of range",
+        "output": {
+            "error_type": "IndexError",
+            "explanation": "You tried to access a position in a list that doesn't exist.",
+            "suggested_fix": "Make sure your index is within the bounds of the list (0 to len(list)-1).",
+            "relevant_links": [
+                "https://docs.python.org/3/library/exceptions.html#IndexError"
+            ]
+        }
+    },
+    {
+        "language": "JavaScript",
+        "input": "TypeError: undefined is not a function",
+        "output": {
+            "error_type": "TypeError",
+            "explanation": "You're trying to call something that isn't defined as a function.",
+            "suggested_fix": "Check if the variable you're calling is actually assigned to a function.",
+            "relevant_links": [
+                "https://developer.mozilla.org/en-US/docs/Web/JavaScript/Reference/Errors/Not_a_function"
+            ]
+        }
+    },
+    {
+        "language": "Java",
+        "input": "NullPointerException",
+        "output": {
+            "error_type": "NullPointerException",
+            "explanation": "You're trying to use an object reference that is null.",
+            "suggested_fix": "Check if the object is null before calling methods or accessing fields on it.",
+            "relevant_links": [
+                "https://docs.oracle.com/javase/8/docs/api/java/lang/NullPointerException.html"
+            ]
+        }
+    }
+]
+
+INSTRUCTION_BLOCK = """You are an expert multilingual debugging assistant.
+
+Your task is to analyze code error messages from various programming languages (like Python, JavaScript, Java, etc.), explain what causes them, suggest a fix, and provide up to 3 helpful documentation links.
+
+Always respond with a raw JSON object in the following format (no markdown, no code blocks):
+
+{
+  "error_type": "...",
+  "explanation": "...",
+  "suggested_fix": "...",
+  "relevant_links": ["...", "...", "..."]
+}
+
+Think step-by-step if needed, but only output the final JSON.
+
+"""
+
+
+def _few_shot_block(examples: list[dict]) -> str:
+    few_shot_block = ""
+    for ex in examples:
+        few_shot_block += f"""Example:
+This is a {ex["language"]} error.
+
+Input:
+{ex["input"]}
+
+Output:
+{json.dumps(ex["output"], indent=2)}
+
+"""
+    return few_shot_block
+
+
+# Shape of an answer, sent as a JSON schema to providers that support constrained output
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "error_explanation",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "error_type": {"type": "string"},
+                "explanation": {"type": "string"},
+                "suggested_fix": {"type": "string"},
+                "relevant_links": {"type": "array", "items": {"type": "string"}},
+            },
+            "required": ["error_type", "explanation", "suggested_fix", "relevant_links"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+# The static part of the prompt for each model family, built once. It is sent as a
+# byte-identical system message on every request so providers can reuse their prompt cache.
+PROMPT_PREFIXES = {
+    "few_shot": INSTRUCTION_BLOCK + _few_shot_block(EXAMPLES),
+    "zero_shot": INSTRUCTION_BLOCK,
+}
+
+
+def prompt_family(model_to_use: str) -> str:
+    profile = MODEL_PROFILES.get(model_to_use)
+    if profile is not None:
+        return "few_shot" if profile["few_shot"] else "zero_shot"
+    # Other model ids: few-shot only for the DeepSeek and Gemini families
+    if any(keyword in model_to_use.lower() for keyword in ["deepseek", "gemini"]):
+        return "few_shot"
+    return "zero_shot"
+
+
+def build_query(error: str, model_to_use: str = "deepseek/deepseek-chat-v3-0324:free") -> str:
+    """The per-request part of the prompt."""
+    # Keep very long traces within the model's budget
+    compaction = compact_error(error, error_token_budget(model_to_use))
+    omitted_note = ""
+    if compaction.elided:
+        omitted_note = f"\n(Omitted to save space: {'; '.join(compaction.elided)}.)\n"
+
+    return f"""Now explain this error:
+
+Input:
+{compaction.text}
+{omitted_note}"""
+
+
+def build_messages(error: str, model_to_use: str = "deepseek/deepseek-chat-v3-0324:free") -> list[dict]:
+    """Chat messages for a request: the cached static prefix as the system message, the error as the user message."""
+    return [
+        {"role": "system", "content": PROMPT_PREFIXES[prompt_family(model_to_use)]},
+        {"role": "user", "content": build_query(error, model_to_use)},
+    ]
+
+
+def build_prompt(error: str, model_to_use="deepseek/deepseek-chat-v3-0324:free") -> str:
+    """The whole prompt as a single string."""
+    return PROMPT_PREFIXES[prompt_family(model_to_use)] + build_query(error, model_to_use)
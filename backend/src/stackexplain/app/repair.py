@@ -0,0 +1,96 @@
+import re, json
+
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.S)
+
+# How often model output needed fixing up before it parsed
+parse_stats = {"parsed": 0, "repaired": 0, "failed": 0}
+
+
+def _close(text: str, stack: list[str]) -> str:
+    return text + "".join("}" if c == "{" else "]" for c in reversed(stack))
+
+
+def _candidates(text: str):
+    """Yield repaired versions of the object starting at text[0], best first.
+
+    The object is scanned once: trailing commas are dropped and scanning stops at the
+    object's closing brace. If the text ends early, an open string is closed along with
+    every open bracket, and then the object is cut back to each earlier comma in turn,
+    so a half-written key or value is dropped rather than guessed at.
+    """
+    out: list[str] = []
+    stack: list[str] = []
+    cuts: list[tuple[int, list[str]]] = []  # (length of out, open brackets) at each comma
+    in_string = escaped = False
+    for ch in text:
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(ch)
+        elif ch in "}]":
+            while out and out[-1] in " \t\r\n,":
+                out.pop()
+            if not stack:
+                break
+            stack.pop()
+            out.append(ch)
+            if not stack:
+                yield "".join(out)
+                return
+            continue
+        elif ch == ",":
+            cuts.append((len(out), list(stack)))
+        out.append(ch)
+
+    tail = "".join(out)
+    if in_string:
+        # Drop a dangling backslash so the closing quote isn't escaped
+        yield _close((tail[:-1] if escaped else tail) + '"', stack)
+    yield _close(tail.rstrip(" \t\r\n,:"), stack)
+    for length, open_brackets in reversed(cuts):
+        yield _close("".join(out[:length]), open_brackets)
+
+
+def parse_json_lenient(content: str) -> tuple[dict, bool]:
+    """Parse the first JSON object in a model's answer, repairing it if needed.
+
+    Handles prose around the object, ```json fences, trailing commas and answers cut off
+    mid-string or mid-list. Returns (object, whether it needed repair). Raises ValueError
+    if no object can be recovered.
+    """
+    content = content.strip()
+    fenced = _FENCE.search(content)
+    if fenced and content.startswith("```"):
+        content = fenced.group(1).strip()
+    try:
+        data = json.loads(content, strict=False)
+        if isinstance(data, dict):
+            parse_stats["parsed"] += 1
+            return data, False
+    except json.JSONDecodeError:
+        pass
+
+    if content.find("{") < 0 and fenced:
+        content = fenced.group(1).strip()
+    # Braces in leading prose can't start the object, so try the next few
+    starts = [m.start() for m in re.finditer(r"\{", content)][:4]
+    for start in starts:
+        for candidate in _candidates(content[start:]):
+            try:
+                data = json.loads(candidate, strict=False)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(data, dict) and data:
+                parse_stats["repaired"] += 1
+                return data, True
+    parse_stats["failed"] += 1
+    raise ValueError("No JSON object found in the model's answer")
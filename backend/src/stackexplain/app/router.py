@@ -0,0 +1,113 @@
+import os, math, time, random, threading
+from .models import MODEL_MAP, MODEL_PROFILES
+from .docs import guess_language
+from .health import breaker
+
+# Models the router chooses between for --model auto, and the order hedges fall back in
+ROUTER_MODELS = [MODEL_MAP["deepseek"], MODEL_MAP["gemini"], MODEL_MAP["mistral"]]
+# Errors up to this size count as short and go to the fastest model that is good enough;
+# longer traces need a model that handles long inputs well (a higher quality floor)
+SHORT_MAX_CHARS = int(os.getenv("STACKEXPLAIN_ROUTER_SHORT_CHARS", "1500"))
+SHORT_MAX_LINES = 15
+QUALITY_FLOOR = {
+    "short": float(os.getenv("STACKEXPLAIN_ROUTER_QUALITY_FLOOR", "0.75")),
+    "long": float(os.getenv("STACKEXPLAIN_ROUTER_LONG_QUALITY_FLOOR", "0.85")),
+}
+# Weight of the newest sample in the moving averages
+EWMA_ALPHA = 0.2
+# A model that gets no traffic drifts back to its assumed success rate over this long (seconds),
+# so one bad spell doesn't keep it out of rotation for good
+RECOVERY_SECONDS = 600.0
+# Share of requests sent to another good-enough model instead of the expected fastest, so
+# estimates stay current for models that would otherwise never be tried
+EXPLORE_RATE = float(os.getenv("STACKEXPLAIN_ROUTER_EXPLORE", "0.05"))
+DEFAULT_PROFILE = {"latency": {"short": 8.0, "long": 15.0}, "quality": {"short": 0.7, "long": 0.7}}
+
+
+def input_class(error_text: str) -> tuple[str, str]:
+    """(size, language) of an error: size is "short" or "long"; language is "unknown" without a hint."""
+    short = len(error_text) <= SHORT_MAX_CHARS and error_text.count("\n") < SHORT_MAX_LINES
+    return ("short" if short else "long"), guess_language(error_text) or "unknown"
+
+
+class Router:
+    """Sends each request to the model expected to answer fastest while meeting a quality floor.
+
+    Latency is a moving average per model and input size. Quality is the model's assumed
+    quality for that size (see MODEL_PROFILES), scaled by its recent success rate on errors
+    in the same language, where failures and unparseable answers both count against it.
+    Models whose circuit breaker is open go last.
+    """
+
+    def __init__(self, models: list[str] | None = None, profiles: dict | None = None):
+        self.models = models or ROUTER_MODELS
+        self.profiles = profiles if profiles is not None else MODEL_PROFILES
+        self._latency: dict[tuple[str, str], float] = {}
+        self._success: dict[tuple[str, str], tuple[float, float]] = {}  # (rate, when last updated)
+        self._lock = threading.Lock()
+
+    def _profile(self, model: str) -> dict:
+        return self.profiles.get(model, DEFAULT_PROFILE)
+
+    def expected_latency(self, model: str, size: str) -> float:
+        return self._latency.get((model, size), self._profile(model)["latency"][size])
+
+    def success_rate(self, model: str, language: str) -> float:
+        rate, updated = self._success.get((model, language), (1.0, 0.0))
+        return 1.0 - (1.0 - rate) * math.exp(-(time.monotonic() - updated) / RECOVERY_SECONDS)
+
+    def quality(self, model: str, size: str, language: str) -> float:
+        return self._profile(model)["quality"][size] * self.success_rate(model, language)
+
+    def record(self, model: str, error_text: str, ok: bool, seconds: float | None = None) -> None:
+        """Account for one model call: whether it produced a usable answer, and how long that took."""
+        size, language = input_class(error_text)
+        with self._lock:
+            rate = self.success_rate(model, language)
+            self._success[(model, language)] = (rate + EWMA_ALPHA * (float(ok) - rate), time.monotonic())
+            if ok and seconds is not None:
+                latency = self.expected_latency(model, size)
+                self._latency[(model, size)] = latency + EWMA_ALPHA * (seconds - latency)
+
+    def choose(self, error_text: str, models: list[str] | None = None) -> dict:
+        """Rank models for an error; the first is the one to ask and the rest are fallbacks for hedging.
+
+        Returns the decision: {"model", "order", "size", "language", "reason", "estimates"}.
+        """
+        models = models or self.models
+        size, language = input_class(error_text)
+        floor = QUALITY_FLOOR[size]
+        estimates = {
+            m: {"seconds": round(self.expected_latency(m, size), 2), "quality": round(self.quality(m, size, language), 3)}
+            for m in models
+        }
+        available = [m for m in models if breaker(m).available()]
+        good = sorted((m for m in available if estimates[m]["quality"] >= floor), key=lambda m: estimates[m]["seconds"])
+        rest = sorted((m for m in models if m not in good), key=lambda m: (m not in available, -estimates[m]["quality"]))
+        if len(good) > 1 and random.random() < EXPLORE_RATE:
+            good.insert(0, good.pop(random.randrange(1, len(good))))
+            reason = f"exploring: trying another model with quality >= {floor} for a {size} error"
+        elif good:
+            reason = f"fastest expected model with quality >= {floor} for a {size} error"
+        elif available:
+            reason = f"no model meets the quality floor ({floor}) for a {size} error; using the best available"
+        else:
+            reason = "every model's circuit breaker is open; using the best of them"
+        order = good + rest
+        return {"model": order[0], "order": order, "size": size, "language": language,
+                "reason": reason, "estimates": estimates}
+
+    def stats(self) -> dict:
+        """Current latency and success estimates, for /health."""
+        with self._lock:
+            return {
+                "latency": {f"{m} ({size})": round(v, 3) for (m, size), v in self._latency.items()},
+                "success": {f"{m} ({language})": round(self.success_rate(m, language), 3)
+                            for (m, language) in self._success},
+            }
+
+
+# The "routing" reported for auto answers that needed no model
+KNOWN_ROUTING = {"model": None, "reason": "known answer (signature, cache or near-duplicate); no model was called"}
+
+router = Router()
@@ -0,0 +1,186 @@
+import os, re, time
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+from .fingerprint import fingerprint
+
+# Longest trace kept in memory; extra frames are dropped (and counted) rather than buffered
+MAX_TRACE_LINES = 400
+
+_PY_START = re.compile(r"Traceback \(most recent call last\):\s*$")
+_PY_CHAIN = re.compile(r"^(During handling of the above exception|The above exception was the direct cause)")
+_HEADER = re.compile(
+    r"^(?:.*?\b)?(?:Uncaught\s+|Exception in thread \"[^\"]*\"\s+)?"
+    r"((?:[\w$]+\.)*[A-Z][\w$]*(?:Error|Exception|Throwable))(?:\s*\[[\w-]+\])?(?::\s.*)?\s*$"
+)
+_AT_FRAME = re.compile(r"^\s+at\s")
+_JAVA_FRAME = re.compile(r"^\s+at\s+[\w$.<>]+\([\w$]+\.(?:java|kt|scala):\d+\)|^\s+at\s+[\w$.<>]+\((?:Native Method|Unknown Source)\)")
+_JAVA_TAIL = re.compile(r"^\s*(?:\.\.\. \d+ (?:more|common frames omitted)|Caused by: |Suppressed: )")
+
+
+@dataclass
+class Trace:
+    language: str
+    lines: list[str]
+    dropped: int = 0
+
+    @property
+    def text(self) -> str:
+        text = "\n".join(self.lines)
+        if self.dropped:
+            text += f"\n... {self.dropped} more lines"
+        return text
+
+    @property
+    def summary(self) -> str:
+        """The line naming the exception."""
+        if self.language == "python":
+            return self.lines[-1].strip()
+        return self.lines[0].strip()
+
+
+class TraceExtractor:
+    """Line-by-line state machine that picks Python, JavaScript and Java stack traces out of a log.
+
+    feed() takes one line at a time and returns any traces that just ended; finish()
+    flushes whatever is still open at the end of the input.
+    """
+
+    def __init__(self, max_lines: int = MAX_TRACE_LINES):
+        self.max_lines = max_lines
+        self.state = "idle"
+        self.trace: Trace | None = None
+        self.header: str | None = None  # possible JS/Java exception line, waiting for an "at" frame
+
+    def _add(self, line: str) -> None:
+        if len(self.trace.lines) < self.max_lines:
+            self.trace.lines.append(line)
+        else:
+            self.trace.dropped += 1
+
+    def _emit(self) -> list[Trace]:
+        trace, self.trace, self.state = self.trace, None, "idle"
+        return [trace] if trace else []
+
+    def feed(self, line: str) -> list[Trace]:
+        line = line.rstrip("\r\n")
+        done: list[Trace] = []
+
+        if self.state == "python":
+            if line.startswith((" ", "\t")):
+                self._add(line)
+                return done
+            if not line.strip():
+                return done
+            # First unindented line is the exception itself
+            self._add(line)
+            self.state = "python_end"
+            return done
+
+        if self.state == "python_end":
+            if not line.strip():
+                return done
+            if _PY_CHAIN.match(line) or _PY_START.search(line):
+                self._add("")
+                self._add(line.strip())
+                if _PY_START.search(line):
+                    self.state = "python"
+                return done
+            if line.startswith((" ", "\t")):
+                # Continuation of a multi-line exception message
+                self._add(line)
+                return done
+            done += self._emit()
+
+        elif self.state == "stack":
+            if _AT_FRAME.match(line) or _JAVA_TAIL.match(line):
+                if self.trace.language == "javascript" and _JAVA_FRAME.match(line):
+                    self.trace.language = "java"
+                self._add(line)
+                return done
+            done += self._emit()
+
+        # idle (or a trace just ended on this line): look for the start of a new one
+        if _PY_START.search(line):
+            self.header = None
+            self.trace = Trace("python", ["Traceback (most recent call last):"])
+            self.state = "python"
+            return done
+        if self.header is not None and _AT_FRAME.match(line):
+            language = "java" if _JAVA_FRAME.match(line) else "javascript"
+            self.trace = Trace(language, [self.header, line])
+            self.header = None
+            self.state = "stack"
+            return done
+        match = _HEADER.match(line)
+        self.header = line[match.start(1):].strip() if match else None
+        return done
+
+    def finish(self) -> list[Trace]:
+        self.header = None
+        return self._emit()
+
+
+def extract_traces(lines: Iterable[str], max_lines: int = MAX_TRACE_LINES) -> Iterator[Trace]:
+    extractor = TraceExtractor(max_lines)
+    for line in lines:
+        yield from extractor.feed(line)
+    yield from extractor.finish()
+
+
+def follow(path: str, poll_interval: float = 0.5, from_start: bool = False) -> Iterator[str]:
+    """Yield lines appended to a file, like `tail -f`. Reopens the file if it is rotated or truncated."""
+    f = open(path, errors="replace")
+    if not from_start:
+        f.seek(0, os.SEEK_END)
+    partial = ""
+    try:
+        while True:
+            line = f.readline()
+            if line:
+                partial += line
+                if partial.endswith("\n"):
+                    yield partial
+                    partial = ""
+                continue
+            try:
+                rotated = os.stat(path).st_ino != os.fstat(f.fileno()).st_ino or os.stat(path).st_size < f.tell()
+            except FileNotFoundError:
+                rotated = False
+            if rotated:
+                f.close()
+                f = open(path, errors="replace")
+                partial = ""
+                continue
+            time.sleep(poll_interval)
+    finally:
+        f.close()
+
+
+@dataclass
+class ErrorGroup:
+    fingerprint: str
+    example: Trace
+    count: int = 0
+    result: dict | None = field(default=None)
+
+
+class TraceDeduper:
+    """Groups traces by fingerprint, keeping the first example and an occurrence count."""
+
+    def __init__(self):
+        self.groups: dict[str, ErrorGroup] = {}
+        self.total = 0
+
+    def add(self, trace: Trace) -> tuple[ErrorGroup, bool]:
+        """Record a trace; returns its group and whether this is the first time it was seen."""
+        self.total += 1
+        key = fingerprint(trace.text)
+        group = self.groups.get(key)
+        is_new = group is None
+        if is_new:
+            group = self.groups[key] = ErrorGroup(key, trace)
+        group.count += 1
+        return group, is_new
+
+    def by_count(self) -> list[ErrorGroup]:
+        return sorted(self.groups.values(), key=lambda g: g.count, reverse=True)
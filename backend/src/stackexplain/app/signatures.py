@@ -0,0 +1,89 @@
+import os, re, json
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+# Extra signature files to load on top of the bundled ones (os.pathsep-separated)
+EXTRA_SIGNATURES = os.getenv("STACKEXPLAIN_SIGNATURES", "")
+# Longer inputs carry context (the user's own frames and messages) that a canned answer would ignore
+SIGNATURE_MAX_LINES = int(os.getenv("STACKEXPLAIN_SIGNATURE_MAX_LINES", "8"))
+
+# Prefixes that runtimes put in front of the exception line
+_PREFIX = re.compile(r'^(?:Uncaught\s+(?:\(in promise\)\s+)?|Exception in thread "[^"]*"\s+|Caused by:\s+)')
+_GROUP = re.compile(r"\(\?P<(\w+)>")
+_GROUP_REF = re.compile(r"\(\?P=(\w+)\)")
+
+
+class _Defaults(dict):
+    def __missing__(self, key):
+        return ""
+
+
+class SignatureIndex:
+    """Known error signatures compiled into one regular expression.
+
+    Each signature's pattern is matched against the whole exception line. All patterns
+    are combined into a single alternation, with each signature's named groups prefixed
+    so they stay distinct, so a lookup is one regex pass per candidate line no matter
+    how many signatures are loaded.
+    """
+
+    def __init__(self, signatures: list[dict] | None = None):
+        self.signatures: list[dict] = []
+        self._combined: re.Pattern | None = None
+        self.hits = 0
+        for sig in signatures or []:
+            self.add(sig)
+
+    @classmethod
+    def load(cls, *paths: str) -> "SignatureIndex":
+        index = cls()
+        for path in paths:
+            with open(path) as f:
+                for sig in json.load(f)["signatures"]:
+                    index.add(sig)
+        return index
+
+    def add(self, signature: dict) -> None:
+        re.compile(signature["pattern"])  # fail early on a bad pattern
+        self.signatures.append(signature)
+        self._combined = None
+
+    def _compile(self) -> re.Pattern:
+        if self._combined is None:
+            parts = []
+            for i, sig in enumerate(self.signatures):
+                pattern = _GROUP.sub(lambda m: f"(?P<s{i}_{m.group(1)}>", sig["pattern"])
+                pattern = _GROUP_REF.sub(lambda m: f"(?P=s{i}_{m.group(1)})", pattern)
+                parts.append(f"(?P<s{i}>{pattern})")
+            self._combined = re.compile("|".join(parts) or r"(?!)")
+        return self._combined
+
+    def match(self, error: str) -> dict | None:
+        """Return a canned explanation if the error is a short, known one; otherwise None."""
+        lines = [line.strip() for line in error.strip().splitlines() if line.strip()]
+        if not lines or len(lines) > SIGNATURE_MAX_LINES:
+            return None
+        combined = self._compile()
+        # Python puts the exception last; JavaScript and Java put it first
+        for line in dict.fromkeys([lines[-1], lines[0]]):
+            m = combined.fullmatch(_PREFIX.sub("", line))
+            if m is None:
+                continue
+            i = int(m.lastgroup[1:])
+            sig = self.signatures[i]
+            prefix = f"s{i}_"
+            self.hits += 1
+            values = _Defaults({k[len(prefix):]: v for k, v in m.groupdict().items()
+                                if k.startswith(prefix) and v is not None})
+            return {
+                "error_type": sig["error_type"].format_map(values),
+                "explanation": sig["explanation"].format_map(values),
+                "suggested_fix": sig["suggested_fix"].format_map(values),
+                "relevant_links": list(sig.get("relevant_links", [])),
+            }
+        return None
+
+
+def default_index() -> SignatureIndex:
+    paths = [os.path.join(DATA_DIR, "signatures.json")]
+    paths += [p for p in EXTRA_SIGNATURES.split(os.pathsep) if p]
+    return SignatureIndex.load(*paths)
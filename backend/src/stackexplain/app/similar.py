@@ -0,0 +1,239 @@
+import os, re, time, sqlite3, hashlib, threading
+from .cache import _connect, RESULT_CACHE_TTL, RESULT_CACHE_DISK_ENTRIES, RESULT_CACHE_PERSIST, PRUNE_EVERY
+from .fingerprint import normalize_error
+from .docs import guess_language
+from . import metrics
+
+# Reuse the answer to a stored error at least this similar (0-1, SimHash bits in common); 1 turns reuse off
+SIMILARITY_THRESHOLD = float(os.getenv("STACKEXPLAIN_SIMILARITY_THRESHOLD", "0.9"))
+# The exception messages must also match on at least this share of their words, in the same places
+MESSAGE_SIMILARITY_THRESHOLD = float(os.getenv("STACKEXPLAIN_MESSAGE_SIMILARITY", "0.8"))
+SIMHASH_BITS = 64
+# Candidates compared per lookup, so a crowded bucket can't make a lookup slow
+MAX_CANDIDATES = 200
+# Most identifiers that may differ between a stored error and a new one for the answer to be adapted
+MAX_SWAPS = 3
+MAX_STORED_CHARS = 4000
+
+_WORD = re.compile(r"<\w+>|[A-Za-z_][\w.]*")
+# Message words, taking quoted literals whole (numbers are left out)
+_MESSAGE_WORD = re.compile(r"'[^'\n]*'|\"[^\"\n]*\"|[A-Za-z_][\w.]*")
+_IDENTIFIER = re.compile(r"[A-Za-z_][\w.]{0,39}")
+# "Name: message" or a bare exception name, unindented (frames and source lines are indented)
+_EXCEPTION_LINE = re.compile(r'^(?:Exception in thread "[^"]*" |Uncaught |Caused by: )?([A-Za-z_$][\w$.]*)(?::(.*))?$')
+
+similar_lookups = metrics.Counter("stackexplain_similar_lookups_total", "Near-duplicate lookups by outcome", ("result",))
+similarity_scores = metrics.Histogram("stackexplain_similarity_score", "Best similarity found per near-duplicate lookup",
+                                      buckets=(0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.93, 0.95, 0.97, 0.99, 1.0))
+
+
+def simhash(words: list[str]) -> int:
+    """64-bit SimHash of a token list, using single words and adjacent pairs as features."""
+    counts = [0] * SIMHASH_BITS
+    for feature in words + [a + " " + b for a, b in zip(words, words[1:])]:
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            counts[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit, count in enumerate(counts) if count > 0)
+
+
+def _signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _bands(value: int, count: int) -> list[int]:
+    """Split a hash into `count` bit ranges. Hashes within count - 1 bits of each other agree on at least one."""
+    bands, start = [], 0
+    for i in range(count):
+        width = (SIMHASH_BITS - start) // (count - i)
+        bands.append(value >> start & ((1 << width) - 1))
+        start += width
+    return bands
+
+
+def exception_line(error: str) -> tuple[str, str]:
+    """(exception class, message) from the line that reports the exception.
+
+    That is the last such line of a Python traceback (the exception that ended it) and the
+    first for other runtimes, which print the exception before its frames. If no line looks
+    like one, the class is "" and the message is that end's first non-empty line.
+    """
+    lines = [line.rstrip() for line in error.splitlines() if line.strip()]
+    if guess_language(error) == "python":
+        lines.reverse()
+    for line in lines:
+        m = _EXCEPTION_LINE.match(line)
+        # Without a message, only a capitalized name (KeyboardInterrupt, not a stray word) counts
+        if m and (m.group(2) is not None or m.group(1).rsplit(".", 1)[-1][:1].isupper()):
+            return m.group(1), (m.group(2) or "").strip()[:MAX_STORED_CHARS]
+    return "", lines[0].strip()[:MAX_STORED_CHARS] if lines else ""
+
+
+def _message_words(message: str) -> list[str]:
+    # Quoted names are kept (they say what went wrong), other quoted values are not
+    words = []
+    for word in _MESSAGE_WORD.findall(message):
+        if word[0] in "'\"":
+            word = word[1:-1] if _IDENTIFIER.fullmatch(word[1:-1]) else "<v>"
+        words.append(word)
+    return words
+
+
+def message_similarity(a: str, b: str) -> float:
+    """Share of words two exception messages have in the same places; 0 if they differ in length."""
+    a_words, b_words = _message_words(a), _message_words(b)
+    if len(a_words) != len(b_words):
+        return 0.0
+    if not a_words:
+        return 1.0
+    return sum(x == y for x, y in zip(a_words, b_words)) / len(a_words)
+
+
+def adapt(result: dict, stored: str, error: str) -> dict:
+    """Swap identifiers in a stored error's answer for the ones in the new error, where they differ one-for-one."""
+    old, new = _WORD.findall(stored), _WORD.findall(error)
+    if len(old) != len(new):
+        return result
+    swaps: dict[str, str] = {}
+    for a, b in zip(old, new):
+        if a != b and swaps.setdefault(a, b) != b:
+            return result  # not a consistent renaming
+    if not swaps or len(swaps) > MAX_SWAPS:
+        return result
+    pattern = re.compile(r"(?<!\w)(" + "|".join(map(re.escape, swaps)) + r")(?!\w)")
+    adapted = dict(result)
+    for field in ("explanation", "suggested_fix"):
+        if isinstance(adapted.get(field), str):
+            adapted[field] = pattern.sub(lambda m: swaps[m.group(1)], adapted[field])
+    return adapted
+
+
+class SimilarityIndex:
+    """Finds previously explained errors that are worded almost the same as a new one.
+
+    Errors are normalized (see fingerprint.py), hashed with SimHash and stored with their
+    hash split into bands, so a lookup only compares errors that share a band (locality-
+    sensitive hashing). With the band count set from the threshold, every stored error
+    within the threshold shares at least one band, so nothing similar enough is missed.
+    The index lives next to the result cache and expires entries with it.
+
+    Shared stack frames can make different errors hash alike, so the exception line is
+    checked on its own as well: the class must be the same and the messages at least
+    `message_threshold` alike (see exception_line and message_similarity).
+    """
+
+    def __init__(self, filename: str = "explanations.sqlite3", threshold: float = SIMILARITY_THRESHOLD,
+                 ttl: float = RESULT_CACHE_TTL, max_entries: int = RESULT_CACHE_DISK_ENTRIES,
+                 persist: bool = RESULT_CACHE_PERSIST, message_threshold: float = MESSAGE_SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self.message_threshold = message_threshold
+        self.max_distance = int((1 - threshold) * SIMHASH_BITS)
+        self.band_count = min(SIMHASH_BITS, self.max_distance + 1)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = threshold < 1
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = _connect(filename) if persist else sqlite3.connect(":memory:", check_same_thread=False)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(similar_errors)")}
+        if columns and "exception" not in columns:
+            # Written before exception lines were stored; those entries can't be checked, so start over
+            self._conn.execute("DROP TABLE similar_errors")
+            self._conn.execute("DROP TABLE IF EXISTS similar_bands")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS similar_errors (id INTEGER PRIMARY KEY, fingerprint TEXT NOT NULL, "
+            "model TEXT NOT NULL, simhash INTEGER NOT NULL, exception TEXT NOT NULL, message TEXT NOT NULL, "
+            "error TEXT NOT NULL, stored_at REAL NOT NULL, UNIQUE (fingerprint, model))"
+        )
+        # Bands depend on the threshold, so they are keyed on the band count as well
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS similar_bands (bands INTEGER NOT NULL, band INTEGER NOT NULL, "
+            "value INTEGER NOT NULL, error_id INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS similar_bands_lookup ON similar_bands (bands, band, value)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS similar_bands_error ON similar_bands (error_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS similar_errors_stored_at ON similar_errors (stored_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def _prepare(error: str) -> tuple[str, list[str], str, str]:
+        text = normalize_error(error)[:MAX_STORED_CHARS]
+        return text, _WORD.findall(text), *exception_line(error)
+
+    def add(self, error: str, fingerprint: str, model: str) -> None:
+        if not self.enabled:
+            return
+        text, words, exception, message = self._prepare(error)
+        if not words:
+            return
+        value = simhash(words)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM similar_bands WHERE error_id IN "
+                "(SELECT id FROM similar_errors WHERE fingerprint = ? AND model = ?)", (fingerprint, model))
+            cursor = self._conn.execute(
+                "INSERT OR REPLACE INTO similar_errors (fingerprint, model, simhash, exception, message, error, stored_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", (fingerprint, model, _signed(value), exception, message, text, now))
+            self._conn.executemany(
+                "INSERT INTO similar_bands (bands, band, value, error_id) VALUES (?, ?, ?, ?)",
+                [(self.band_count, i, band, cursor.lastrowid) for i, band in enumerate(_bands(value, self.band_count))])
+            self._writes += 1
+            if self._writes % PRUNE_EVERY == 0:
+                self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM similar_errors").fetchone()
+        expired = self._conn.execute(
+            "SELECT id FROM similar_errors WHERE stored_at < ? UNION "
+            "SELECT id FROM (SELECT id FROM similar_errors ORDER BY stored_at LIMIT ?)",
+            (now - self.ttl, max(0, count - self.max_entries))).fetchall()
+        self._conn.executemany("DELETE FROM similar_bands WHERE error_id = ?", expired)
+        self._conn.executemany("DELETE FROM similar_errors WHERE id = ?", expired)
+
+    def match(self, error: str, models: list[str], lookup) -> tuple[dict, str, float] | None:
+        """The most similar stored error's answer, adapted to `error`, as (result, model, similarity).
+
+        `lookup(fingerprint, model)` fetches stored answers; errors raising a different exception
+        class are never matched. Returns None if nothing is similar enough.
+        """
+        if not self.enabled:
+            return None
+        text, words, exception, message = self._prepare(error)
+        if not words:
+            return None
+        value = simhash(words)
+        bands = _bands(value, self.band_count)
+        # Stored errors sharing the most bands with this one are likeliest to be close
+        shared = " UNION ALL ".join(["SELECT error_id FROM similar_bands WHERE bands = ? AND band = ? AND value = ?"] * len(bands))
+        params = [p for i, band in enumerate(bands) for p in (self.band_count, i, band)]
+        # The limit applies after the class and model filters, so other errors can't crowd out the ones that count
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT e.fingerprint, e.model, e.simhash, e.message, e.error FROM "
+                f"(SELECT error_id, COUNT(*) AS shared FROM ({shared}) GROUP BY error_id) c "
+                f"JOIN similar_errors e ON e.id = c.error_id WHERE e.stored_at >= ? AND e.exception = ? "
+                f"AND e.model IN ({', '.join('?' * len(models))}) ORDER BY c.shared DESC LIMIT {MAX_CANDIDATES}",
+                [*params, time.time() - self.ttl, exception, *models]).fetchall()
+        scored = []
+        for fingerprint, model, stored_hash, stored_message, stored_text in rows:
+            if message_similarity(stored_message, message) < self.message_threshold:
+                continue
+            distance = bin((stored_hash & ((1 << 64) - 1)) ^ value).count("1")
+            scored.append((1 - distance / SIMHASH_BITS, models.index(model), fingerprint, model, stored_text))
+        if not scored:
+            similar_lookups.inc(result="miss")
+            return None
+        scored.sort(key=lambda s: (-s[0], s[1]))
+        similarity_scores.observe(scored[0][0])
+        for score, _, fingerprint, model, stored_text in scored:
+            if score < self.threshold:
+                break
+            result = lookup(fingerprint, model)
+            if result is not None:
+                similar_lookups.inc(result="hit")
+                return adapt(result, stored_text, text), model, score
+        similar_lookups.inc(result="miss")
+        return None
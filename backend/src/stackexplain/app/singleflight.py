@@ -0,0 +1,35 @@
+import asyncio, copy
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one underlying computation.
+
+    The first caller for a key starts the work; callers that arrive while it is still
+    running wait for the same result. Each caller gets its own copy of the result.
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Future] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is None or future.get_loop() is not asyncio.get_running_loop():
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+            future.add_done_callback(lambda f: self._forget(key, f))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        # Shield so one caller going away (e.g. a client disconnect) doesn't cancel the others' work
+        result = await asyncio.shield(future)
+        return copy.deepcopy(result)
+
+    def _forget(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
+
+    def in_flight(self) -> int:
+        return len(self._calls)
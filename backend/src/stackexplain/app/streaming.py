@@ -0,0 +1,73 @@
+import json
+
+_decoder = json.JSONDecoder()
+_WS = " \t\r\n"
+
+
+class IncrementalFieldParser:
+    """Parses a streamed JSON object and reports each top-level field as soon as its value is complete.
+
+    Feed it chunks of the model's output with feed(); it returns the (key, value) pairs that
+    completed in that chunk. Leading prose or a ```json fence before the object is skipped.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields: dict = {}
+        self._pos: int | None = None  # index just past '{' or the last parsed field
+        self.done = False
+
+    def feed(self, chunk: str) -> list[tuple[str, object]]:
+        self.buffer += chunk
+        if self.done:
+            return []
+        if self._pos is None:
+            start = self.buffer.find("{")
+            if start < 0:
+                return []
+            self._pos = start + 1
+        completed = []
+        while True:
+            parsed = self._next_field()
+            if parsed is None:
+                break
+            key, value = parsed
+            self.fields[key] = value
+            completed.append((key, value))
+        return completed
+
+    def _skip(self, pos: int, chars: str) -> int:
+        while pos < len(self.buffer) and self.buffer[pos] in chars:
+            pos += 1
+        return pos
+
+    def _next_field(self) -> tuple[str, object] | None:
+        buf = self.buffer
+        pos = self._skip(self._pos, _WS + ",")
+        if pos >= len(buf):
+            return None
+        if buf[pos] == "}":
+            self.done = True
+            return None
+        try:
+            key, pos = _decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            return None
+        pos = self._skip(pos, _WS)
+        if pos >= len(buf) or buf[pos] != ":":
+            return None
+        pos = self._skip(pos + 1, _WS)
+        try:
+            value, end = _decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            return None
+        # A number or literal at the very end of the buffer may still be growing
+        if end >= len(buf) and not isinstance(value, (str, list, dict)):
+            return None
+        self._pos = end
+        return str(key), value
+
+
+def sse_event(event: str, data) -> str:
+    """Format one Server-Sent Events message with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
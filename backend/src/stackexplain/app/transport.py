@@ -0,0 +1,185 @@
+import os, asyncio, threading
+from importlib.util import find_spec
+import httpx
+
+# Connection pool shared by the LLM client and the link checker
+HTTP_MAX_CONNECTIONS = int(os.getenv("STACKEXPLAIN_HTTP_MAX_CONNECTIONS", "64"))
+# Concurrent requests allowed to any one host (docs sites shouldn't see a burst from us).
+# The model API is exempt (see exempt_host): the admission queue already bounds those calls.
+HTTP_MAX_PER_HOST = int(os.getenv("STACKEXPLAIN_HTTP_MAX_PER_HOST", "16"))
+HTTP_KEEPALIVE_SECONDS = 30.0
+# HTTP/2 needs the optional h2 package (pip install "httpx[http2]")
+HTTP2 = os.getenv("STACKEXPLAIN_HTTP2", "1") != "0" and find_spec("h2") is not None
+CONNECT_TIMEOUT = float(os.getenv("STACKEXPLAIN_CONNECT_TIMEOUT", "5"))
+# Read timeout for model calls; link checks use their own shorter one
+LLM_TIMEOUT = float(os.getenv("STACKEXPLAIN_LLM_TIMEOUT", "60"))
+
+
+def timeout(read: float) -> httpx.Timeout:
+    return httpx.Timeout(read, connect=CONNECT_TIMEOUT)
+
+
+# Hosts whose requests skip the per-host limit
+_exempt_hosts: set[str] = set()
+
+
+def exempt_host(host: str) -> None:
+    """Let requests to `host` skip the per-host limit (used for the model API)."""
+    _exempt_hosts.add(host)
+
+
+def _pool_timeout(request: httpx.Request) -> float | None:
+    """How long a request may wait for a host slot: its pool timeout, like waiting for a connection."""
+    return request.extensions.get("timeout", {}).get("pool")
+
+
+class _ReleaseOnClose(httpx.SyncByteStream, httpx.AsyncByteStream):
+    """Response body wrapper that gives back the host slot once the body is closed."""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        yield from self._stream
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    def _done(self) -> None:
+        if self._release is not None:
+            self._release()
+            self._release = None
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            self._done()
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._done()
+
+
+def _pool_args() -> dict:
+    return {
+        "http2": HTTP2,
+        "limits": httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                               max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                               keepalive_expiry=HTTP_KEEPALIVE_SECONDS),
+    }
+
+
+class PooledTransport(httpx.BaseTransport):
+    """Keep-alive connection pool with a limit on concurrent requests per host."""
+
+    def __init__(self, per_host: int = HTTP_MAX_PER_HOST):
+        self.per_host = per_host
+        self._pool: httpx.HTTPTransport | None = None
+        self._hosts: dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        with self._lock:
+            if self._pool is None:
+                self._pool = httpx.HTTPTransport(**_pool_args())
+            pool = self._pool
+            slot = None
+            if request.url.host not in _exempt_hosts:
+                slot = self._hosts.setdefault(request.url.host, threading.BoundedSemaphore(self.per_host))
+        if slot is None:
+            return pool.handle_request(request)
+        wait = _pool_timeout(request)
+        if not slot.acquire(timeout=wait):
+            raise httpx.PoolTimeout(f"No free slot for {request.url.host} within {wait}s", request=request)
+        try:
+            response = pool.handle_request(request)
+        except BaseException:
+            slot.release()
+            raise
+        response.stream = _ReleaseOnClose(response.stream, slot.release)
+        return response
+
+    def close(self) -> None:
+        """Close pooled connections; the next request opens a fresh pool."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+
+
+class AsyncPooledTransport(httpx.AsyncBaseTransport):
+    """Async version of PooledTransport.
+
+    Connections belong to the event loop that opened them, so when a new loop starts
+    using the transport (the CLI runs one per asyncio.run) it gets a new pool.
+    """
+
+    def __init__(self, per_host: int = HTTP_MAX_PER_HOST):
+        self.per_host = per_host
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._pool: httpx.AsyncHTTPTransport | None = None
+        self._hosts: dict[str, asyncio.Semaphore] = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        loop = asyncio.get_running_loop()
+        if self._pool is None or loop is not self._loop:
+            self._loop, self._pool, self._hosts = loop, httpx.AsyncHTTPTransport(**_pool_args()), {}
+        pool = self._pool
+        if request.url.host in _exempt_hosts:
+            return await pool.handle_async_request(request)
+        slot = self._hosts.setdefault(request.url.host, asyncio.Semaphore(self.per_host))
+        wait = _pool_timeout(request)
+        try:
+            await asyncio.wait_for(slot.acquire(), wait)
+        except asyncio.TimeoutError:
+            raise httpx.PoolTimeout(f"No free slot for {request.url.host} within {wait}s", request=request) from None
+        try:
+            response = await pool.handle_async_request(request)
+        except BaseException:
+            slot.release()
+            raise
+        response.stream = _ReleaseOnClose(response.stream, slot.release)
+        return response
+
+    async def aclose(self) -> None:
+        """Close pooled connections; the next request opens a fresh pool."""
+        pool, self._pool, self._loop = self._pool, None, None
+        if pool is not None:
+            await pool.aclose()
+
+
+_sync_transport = PooledTransport()
+_async_transport = AsyncPooledTransport()
+_sync_client: httpx.Client | None = None
+_async_client: httpx.AsyncClient | None = None
+
+
+def sync_client() -> httpx.Client:
+    """The process-wide pooled HTTP client for blocking code."""
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = httpx.Client(transport=_sync_transport, timeout=timeout(LLM_TIMEOUT))
+    return _sync_client
+
+
+def async_client() -> httpx.AsyncClient:
+    """The process-wide pooled HTTP client for async code."""
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(transport=_async_transport, timeout=timeout(LLM_TIMEOUT))
+    return _async_client
+
+
+def close() -> None:
+    """Close the blocking client's pooled connections."""
+    _sync_transport.close()
+
+
+async def aclose() -> None:
+    """Close the async client's pooled connections. The clients stay usable and reconnect on demand."""
+    await _async_transport.aclose()
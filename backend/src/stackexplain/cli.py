@@ -2,15 +2,26 @@
 
 import argparse
 import sys
-import pyperclip
 import platform
-from stackexplain.app.core import explain_error
+import json
+import atexit
+# Only light modules are imported up front; the LLM client and friends load when a path needs them
+from stackexplain.app.models import MODEL_MAP
 
-MODEL_MAP = {
-    "deepseek": "deepseek/deepseek-chat-v3-0324:free",
-    "gemini": "google/gemini-2.0-flash-exp:free",
-    "mistral": "mistralai/mistral-small-3.2-24b-instruct:free",
-}
+def run(coro):
+    """asyncio.run, closing pooled connections before the event loop goes away."""
+    import asyncio
+    async def with_cleanup():
+        from stackexplain.app import core
+        try:
+            return await coro
+        finally:
+            await core.aclose()
+    return asyncio.run(with_cleanup())
+
+def close_connections():
+    if "stackexplain.app.core" in sys.modules:
+        sys.modules["stackexplain.app.core"].close()
 
 def get_error_input():
     if not sys.stdin.isatty():
@@ -24,6 +35,7 @@ def get_error_input():
         if error_input.strip():
             return error_input
         else:
+            import pyperclip
             try:
                 clipboard_text = pyperclip.paste()
                 if clipboard_text.strip():
@@ -45,35 +57,262 @@ def get_error_input():
                     print("Unknown OS. Clipboard may not be supported.")
                 sys.exit(1)
 
+FIELD_LABELS = {
+    "error_type": "• Error Type:    ",
+    "explanation": "• Explanation:   ",
+    "suggested_fix": "• Suggested Fix: ",
+}
+
+def print_links(links):
+    if len(links) > 0:
+        print(f"• More Info:")
+        for link in links:
+            print(f"    • {link}")
+
+def print_result(result):
+    print(f"• Error Type:    {result['error_type']}")
+    print(f"• Explanation:   {result['explanation']}")
+    print(f"• Suggested Fix: {result['suggested_fix']}")
+
+    print_links(result.get('relevant_links', []))
+
+def print_event(event, data):
+    if event in FIELD_LABELS:
+        print(f"{FIELD_LABELS[event]}{data}", flush=True)
+    elif event == "relevant_links":
+        print_links(data)
+
+async def stream_explanation(error, model_full_name, force_llm=False):
+    """Print each part of the explanation as soon as it arrives."""
+    from stackexplain.app.core import explain_error_stream
+    async for event, data in explain_error_stream(error, model_to_use=model_full_name, force_llm=force_llm):
+        print_event(event, data)
+
+def print_profile(timings, started):
+    """Print where the time went, by stage, slowest first."""
+    import time
+    print("\nProfile:", file=sys.stderr)
+    for stage, (seconds, count) in sorted(timings.items(), key=lambda item: -item[1][0]):
+        calls = f"  ({count} calls)" if count > 1 else ""
+        print(f"  {stage:<10}{seconds * 1000:9.1f} ms{calls}", file=sys.stderr)
+    print(f"  {'total':<10}{(time.perf_counter() - started) * 1000:9.1f} ms", file=sys.stderr)
+
+def explain_via_daemon(error, args, model_full_name):
+    """Let a running daemon answer. Returns False (having printed nothing) if there is no daemon to ask."""
+    from stackexplain.app import daemon
+    sock = daemon.connect()
+    if sock is None:
+        return False
+    stream = not args.no_stream and model_full_name != "auto"
+    request = {"error": error, "model": model_full_name, "force_llm": args.force_llm, "stream": stream}
+    printed = False
+    try:
+        for event, data in daemon.events(sock, request):
+            if stream:
+                print_event(event, data)
+                printed = printed or event in FIELD_LABELS
+            elif event == "done":
+                print_result(data)
+                printed = True
+    except BrokenPipeError:
+        raise  # our own stdout went away, not the daemon
+    except (daemon.DaemonError, OSError, ValueError) as e:
+        print(f"⚠️ Daemon error: {e}", file=sys.stderr)
+        if printed:
+            sys.exit(1)
+        return False
+    return True
+
+def run_daemon():
+    from stackexplain.app import core, daemon
+    print(f"explainerr daemon listening on {daemon.SOCKET_PATH} (Ctrl+C to stop)", flush=True)
+    if not core.api_key:
+        print("⚠️ OPENROUTER_API_KEY is not set: only known and cached errors can be answered", file=sys.stderr)
+    try:
+        run(daemon.serve())
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+def read_batch_items(f, model_full_name, force_llm=False):
+    """Parse JSONL lines lazily, reporting and skipping lines that aren't valid items."""
+    from stackexplain.app.batch import parse_item
+    for index, line in enumerate(f, start=1):
+        try:
+            yield parse_item(line, index, default_model=model_full_name, force_llm=force_llm)
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"⚠️ Skipping line {index}: {e}", file=sys.stderr)
+
+async def run_batch(args, model_full_name):
+    from stackexplain.app.batch import explain_batch, read_checkpoint
+    from stackexplain.app.core import is_failure
+    done_ids = read_checkpoint(args.checkpoint)
+    source = sys.stdin if args.batch == "-" else open(args.batch)
+    output = sys.stdout if args.output == "-" else open(args.output, "a")
+    checkpoint = open(args.checkpoint, "a") if args.checkpoint else None
+    count = 0
+    try:
+        items = read_batch_items(source, model_full_name, args.force_llm)
+        async for record in explain_batch(items, concurrency=args.concurrency, skip_ids=done_ids):
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            # Failed items aren't checkpointed, so a resumed run retries them
+            if checkpoint and not is_failure(record["result"]):
+                checkpoint.write(record["id"] + "\n")
+                checkpoint.flush()
+            count += 1
+    finally:
+        for f in (source, output, checkpoint):
+            if f not in (None, sys.stdin, sys.stdout):
+                f.close()
+    print(f"Explained {count} errors ({len(done_ids)} skipped from checkpoint).", file=sys.stderr)
+
+def print_group_header(group):
+    print(f"\n[{group.count}×] {group.example.language}: {group.example.summary}")
+
+async def run_scan(args, model_full_name):
+    """Explain each distinct stack trace in a log file once, then print them by frequency."""
+    from stackexplain.app.scan import extract_traces, TraceDeduper
+    from stackexplain.app.batch import explain_batch
+    deduper = TraceDeduper()
+    source = sys.stdin if args.scan == "-" else open(args.scan, errors="replace")
+    try:
+        for trace in extract_traces(source):
+            deduper.add(trace)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+    groups = deduper.by_count()
+    print(f"Found {deduper.total} stack traces, {len(groups)} distinct. Reasoning...", flush=True)
+    items = [{"id": g.fingerprint, "error": g.example.text, "model": model_full_name, "force_llm": args.force_llm}
+             for g in groups]
+    async for record in explain_batch(items, concurrency=args.concurrency):
+        deduper.groups[record["id"]].result = record["result"]
+    for group in groups:
+        print_group_header(group)
+        print_result(group.result)
+
+def explain_trace(text, model_full_name):
+    if model_full_name == "auto":
+        from stackexplain.app.hedge import explain_error_auto
+        return run(explain_error_auto(text))
+    from stackexplain.app.core import explain_error
+    return explain_error(text, model_to_use=model_full_name)
+
+def run_follow(args, model_full_name):
+    """Watch a log file and explain each new distinct stack trace as it appears."""
+    from stackexplain.app.scan import TraceExtractor, TraceDeduper, follow
+    extractor = TraceExtractor()
+    deduper = TraceDeduper()
+    print(f"Watching {args.scan} for stack traces (Ctrl+C to stop)...", flush=True)
+    try:
+        for line in follow(args.scan):
+            for trace in extractor.feed(line):
+                group, is_new = deduper.add(trace)
+                if is_new:
+                    print_group_header(group)
+                    print_result(explain_trace(trace.text, model_full_name))
+                    sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+    for trace in extractor.finish():
+        deduper.add(trace)
+    print(f"\nSummary: {deduper.total} stack traces, {len(deduper.groups)} distinct")
+    for group in deduper.by_count():
+        print(f"  {group.count:>6}×  {group.example.language}: {group.example.summary}")
+
 def main():
     parser = argparse.ArgumentParser(description="Application CLI")
     parser.add_argument("error", nargs="?", help="Error message (optional: use stdin or clipboard)")
     parser.add_argument(
         "--model",
-        choices=MODEL_MAP.keys(),
+        choices=[*MODEL_MAP.keys(), "auto"],
         default="deepseek",
-        help="Choose model to use: deepseek (default), gemini, or mistral"
+        help="Choose model to use: deepseek (default), gemini, mistral, or auto "
+             "(the fastest model that is good enough for the error, racing another when it is slow)"
+    )
+    parser.add_argument(
+        "--no-stream",
+        action="store_true",
+        help="Wait for the full explanation instead of printing it as it arrives"
+    )
+    parser.add_argument(
+        "--force-llm",
+        action="store_true",
+        help="Always ask the model, even for common errors that have a built-in answer"
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="FILE",
+        help="Explain every error in a JSONL file ('-' for stdin) and write results as JSONL"
+    )
+    parser.add_argument("--output", default="-", metavar="FILE", help="Where to write batch results (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=8, help="How many errors to explain at once in --batch/--scan (default: 8)")
+    parser.add_argument("--checkpoint", metavar="FILE", help="Record finished batch ids here and skip them on the next run")
+    parser.add_argument(
+        "--scan",
+        metavar="FILE",
+        help="Find stack traces in a log file ('-' for stdin) and explain each distinct one once"
+    )
+    parser.add_argument("--follow", action="store_true", help="With --scan, keep watching the file for new traces")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Run a resident daemon that keeps clients and caches warm; later explainerr calls use it automatically"
     )
+    parser.add_argument("--no-daemon", action="store_true", help="Don't use a running daemon for this call")
+    parser.add_argument("--profile", action="store_true", help="Print how long each stage took (implies --no-daemon)")
     args = parser.parse_args()
+    atexit.register(close_connections)
+    if args.profile:
+        import time
+        from stackexplain.app.metrics import start_request
+        args.no_daemon = True
+        atexit.register(print_profile, start_request(), time.perf_counter())
+
+    model_full_name = MODEL_MAP.get(args.model, args.model)
+
+    if args.daemon:
+        run_daemon()
+        return
+
+    if args.follow and (not args.scan or args.scan == "-"):
+        parser.error("--follow needs --scan FILE")
+    if args.scan and args.follow:
+        run_follow(args, model_full_name)
+        return
+    if args.scan:
+        run(run_scan(args, model_full_name))
+        return
+
+    if args.batch:
+        run(run_batch(args, model_full_name))
+        return
 
     if args.error:
         error = args.error
     else:
         error = get_error_input()
 
-    model_full_name = MODEL_MAP.get(args.model, MODEL_MAP["deepseek"])
+    print("Reasoning...", flush=True)
+    if not args.no_daemon and explain_via_daemon(error, args, model_full_name):
+        return
+    if model_full_name == "auto":
+        # Racing models needs the complete answer, so auto mode doesn't stream
+        from stackexplain.app.hedge import explain_error_auto
+        print_result(run(explain_error_auto(error, force_llm=args.force_llm)))
+        return
 
-    print("Reasoning...")
-    result = explain_error(error, model_to_use=model_full_name)
+    if not args.no_stream:
+        run(stream_explanation(error, model_full_name, force_llm=args.force_llm))
+        return
 
-    print(f"• Error Type:    {result['error_type']}")
-    print(f"• Explanation:   {result['explanation']}")
-    print(f"• Suggested Fix: {result['suggested_fix']}")
-
-    if len(result.get('relevant_links', [])) > 0:
-        print(f"• More Info:")
-        for link in result['relevant_links']:
-            print(f"    • {link}")
+    from stackexplain.app.core import explain_error
+    result = explain_error(error, model_to_use=model_full_name, force_llm=args.force_llm)
+    print_result(result)
 
 if __name__ == "__main__":
     main()